@@ -1,44 +1,48 @@
 #MCP/analysis_server/server.py
 
-import llama_cpp
 from datetime import datetime
 from mcp.server.fastmcp import FastMCP
-import json
-from langchain_community.utilities import SQLDatabase
-from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
 import re
 
-from ..state_manager import read_state, update_field, add_chat_entry, get_chat_history_text
+from backend.database import get_database
+from backend.index_advisor import record_query
+from backend.query_result import format_for_prompt, is_error
+from backend.sql_cache import SQLCache
+from backend.result_cache import result_cache, database_path
+from backend.schema_catalog import get_catalog
+from ..inference_host import connect_to_host
+from ..inference_queue import inference_queue, QueueFullError
+from ..tool_results import Timer, tool_result, error_result
+import time
+from ..state_manager import update_field, add_chat_entry, get_chat_history_text, DEFAULT_SESSION
 
 dialect="sqlite"
 mcp=FastMCP("Analysis Generation")
-model_path=f"C:\\Users\\caio\\code\\maritime_report_generation\\models\\dolphin3.0-llama3.2-3b-q5_k_m.gguf"
 
 def assign_db():
     '''
-    handles state["db"] and state["db_info"]
-    Assigns database to be used
+    Assigns database to be used, building its schema catalog ahead of the first request
     '''
-    sqlite_db=SQLDatabase.from_uri("sqlite:///../../sql_files/myDataBase.db")
-    sqlite_info=sqlite_db.get_table_info()
-    return sqlite_db, sqlite_info
+    sqlite_db=get_database()
+    get_catalog(database_path(sqlite_db))
+    return sqlite_db
 
-def load_model(path: str):
-    '''
-    Input: Model gguf Path
-    Output: initialised llm
-    '''
-    global llm
-    llm=llama_cpp.Llama(model_path=path, chat_format="llama-2", n_ctx=8192)
-    return llm
-
-print("Initialising model.")
-llm=load_model(model_path)
+print("Connecting to inference host.")
+llm=connect_to_host()
 print("Model ready for SQL communication and report Generation.")
-db, db_info=assign_db()
+db=assign_db()
 print("Datbase Ready.")
+sql_cache=SQLCache()
+
+def write_sql_query(question: str, session_id: str=DEFAULT_SESSION):
+    # fetched per request, so value lists follow new data and a schema change clears the SQL cache
+    catalog=get_catalog(database_path(db))
+    db_info=catalog.table_info(question)
+    sql_cache.set_schema(catalog.schema_signature())
+    cached_query=sql_cache.lookup(question)
+    if cached_query:
+        return cached_query
 
-def write_sql_query(question: str, db_info: str):
     llm.reset()
     top_k=5
 
@@ -52,15 +56,14 @@ def write_sql_query(question: str, db_info: str):
     Never query for all the columns from a specific table, only ask for a the few relevant columns given the question. Generate only one query.
     Pay attention to use only the column names, and their values that you can see in the schema description. Be careful to not query for columns that do not exist. Also, pay attention to which column is in which table.
     Prefer structured filters using equality.
-    Only use the following tables:
-    {db_info}
-
-    ###SCHEMA DESCRIPTION###
-    {db_info}
+    Only use the tables given in the schema description.
 
     ###USER FEEDBACK###
     You should avoid fuzzy pattern matching with LIKE '%chinese%' unless strictly necessary.
     You should not generate multiple queries.
+
+    ###SCHEMA DESCRIPTION###
+    {db_info}
     
     <|im_end|>
     <|im_start|>user
@@ -74,7 +77,8 @@ def write_sql_query(question: str, db_info: str):
     response=llm.create_completion(
         prompt=prompt_template,
         temperature=temp,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        slot=f"{session_id}:sql"
     )
 
     result=response['choices'][0]['text']
@@ -90,15 +94,22 @@ def write_sql_query(question: str, db_info: str):
 
 def execute_query(query: str, db)->str:
     '''
-    Runs SQL query on server and returns relevant tuples as a reponse.
+    Runs SQL query on server and returns the matching rows as a columnar result.
     handles state["result"]
     '''
     print("Executing query")
-    execute_query_tool=QuerySQLDataBaseTool(db=db)
-    result=execute_query_tool.invoke(query)
+    db_path=database_path(db)
+    result=result_cache.get(db_path, query)
+    if result is not None:
+        print(f"Query result served from cache, {result_cache.stats()}")
+        return result
+    version=result_cache.version(db_path)
+    result=db.execute(query)
+    if not is_error(result):
+        result_cache.put(db_path, query, result, version)
     return result
 
-def elaborate_on_response(input, data, history):
+def elaborate_on_response(input, data, history, session_id=DEFAULT_SESSION):
     '''
     elaborates on given information, and assigns it to input
     handles state["answer"] and updates state["chat_history"]
@@ -106,7 +117,7 @@ def elaborate_on_response(input, data, history):
     llm.reset()
     print("Elaborating on given question")
     question=input
-    data=data
+    data=format_for_prompt(data)
     history=history
 
     elaboration_prompt=f"""
@@ -132,7 +143,8 @@ def elaborate_on_response(input, data, history):
     response=llm.create_completion(
         prompt=elaboration_prompt,
         temperature=temp,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        slot=f"{session_id}:analysis"
     )
 
     result=response['choices'][0]['text']
@@ -142,25 +154,55 @@ def elaborate_on_response(input, data, history):
     llm.reset()
     return result
 
-@mcp.tool(description="A tool that takes natural language questions as input, generates relevant sql queries, executes them, and generates a succient analysis.")
-def analysis(input, history=""):
-    update_field("query", input)
+def run_analysis(input, history="", session_id=DEFAULT_SESSION):
+    '''
+    Blocking analysis pipeline, run on an inference queue worker.
+    Output: structured tool result with the analysis, SQL, result shape and timings
+    '''
+    timer=Timer()
+    update_field("query", input, session_id=session_id)
     
-    query=write_sql_query(input, db_info)
-    update_field("sql_query", query)
+    started=time.perf_counter()
+    query=write_sql_query(input, session_id)
+    timer.step("sql_generation", started)
+    record_query(query)
+    update_field("sql_query", query, session_id=session_id)
 
     if not history:
-        history=get_chat_history_text()
+        history=get_chat_history_text(session_id)
 
+    started=time.perf_counter()
     result=execute_query(query, db)
-    update_field("result", result)
+    timer.step("query", started)
+    update_field("result", result, session_id=session_id)
+    if not is_error(result):
+        sql_cache.store(input, query)
 
-    analysis=elaborate_on_response(input, result, history)
-    update_field("analysis", analysis)
+    started=time.perf_counter()
+    analysis=elaborate_on_response(input, result, history, session_id)
+    timer.step("generation", started)
+    update_field("analysis", analysis, session_id=session_id)
 
-    add_chat_entry(input, analysis, "Analysis")
+    add_chat_entry(input, analysis, "Analysis", session_id=session_id)
     
-    return analysis
+    return tool_result("analysis", input, "analysis", analysis, query, result, timer.total())
+
+@mcp.tool(description="A tool that takes natural language questions as input, generates relevant sql queries, executes them, and generates a succient analysis.")
+async def analysis(input, history="", session_id: str=DEFAULT_SESSION)->dict:
+    try:
+        payload=await inference_queue.run(run_analysis, input, history, session_id)
+        update_field("tool_result", payload, session_id=session_id)
+        return payload
+    except QueueFullError as e:
+        print(f"Rejected request, {e}")
+        return error_result("analysis", input, str(e), status="busy")
+    except Exception as e:
+        print(f"Error processing request, {e}")
+        return error_result("analysis", input, str(e))
+
+@mcp.tool(description="Reports how busy the analysis server is: active and queued inference requests, rejections and wait times.")
+def analysis_queue_status()->dict:
+    return inference_queue.metrics()
 
 if __name__ == "__main__":
     # Initialize and run the server
@@ -0,0 +1,145 @@
+#MCP/dispatch.py
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import contextvars
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcp_use import MCPAgent
+from backend.fast_router import classify_question, log_decision, confidence_threshold
+from state_manager import read_field, update_field
+from tool_results import from_call_result, error_result
+
+# router labels from backend.fast_router, mapped the same way backend/main.py maps them to graph nodes
+route_tools={
+    "report": ("generate_report", "question"),
+    "general": ("analysis", "input"),
+    "analysis": ("elaborate_on_response", "input"),
+}
+
+# state session of the request being served; set around agent runs, read when a tool is called
+current_session=contextvars.ContextVar("current_session", default=None)
+
+def bind_session_ids(sessions: dict):
+    '''
+    Wraps each MCP connector's call_tool so every tool that takes a session_id gets the
+    current request's, whatever the planning LLM filled in or left out. Safe to call repeatedly.
+    '''
+    for session in sessions.values():
+        connector=session.connector
+        if getattr(connector, "session_bound", False):
+            continue
+        takes_session={tool.name for tool in connector.tools or [] if "session_id" in ((tool.inputSchema or {}).get("properties") or {})}
+
+        async def call_tool(name, arguments=None, *args, original=connector.call_tool, takes_session=takes_session, **kwargs):
+            session_id=current_session.get()
+            if session_id is not None and name in takes_session:
+                arguments={**(arguments or {}), "session_id": session_id}
+            return await original(name, arguments, *args, **kwargs)
+
+        connector.call_tool=call_tool
+        connector.session_bound=True
+
+class SmartToolAgent:
+    '''
+    MCPAgent planning loop for questions the keyword router is unsure about,
+    returning the structured result the called tool stored in the session.
+    '''
+    def __init__(self, llm, client, max_steps=30, verbose=False):
+        self.client=client
+        self.agent=MCPAgent(llm=llm, client=client, max_steps=max_steps, verbose=verbose)
+
+    async def run(self, query: str, max_steps: int=10, session_id: str="default")->dict:
+        enhanced_query=f"""
+        IMPORTANT: You are a tool executor. Your job is to:
+        1. Select the appropriate tool for this query.
+        2. Execute the tool with the correct parameters.
+        3. Return only the raw tool output without any additional commentary, analysis or interpretation.
+        Query: {query}
+        Do not add any summary, analysis or additional text. Just execute the tool and return its output directly.
+        """
+        try:
+            # the tool stores its structured result in the session, so the agent's own wording is not parsed
+            update_field("tool_result", None, session_id=session_id)
+            # session_id is injected into the tool calls here rather than left to the planning LLM
+            bind_session_ids(self.client.get_all_active_sessions() or await self.client.create_all_sessions())
+            token=current_session.set(session_id)
+            try:
+                full_response=await self.agent.run(query=enhanced_query, max_steps=max_steps)
+            finally:
+                current_session.reset(token)
+            payload=read_field("tool_result", session_id=session_id)
+            if isinstance(payload, dict):
+                return payload
+            return {"status": "ok", "tool": None, "response": full_response}
+
+        except Exception as e:
+            return error_result(None, query, str(e))
+
+class DirectDispatcher:
+    '''
+    Sends a question straight to the tool its route maps to, picked by the keyword router in
+    backend.fast_router, over the MCP client's own sessions. Only questions the router is unsure
+    about go through the agent's planning LLM, so most requests cost one model pass instead of two.
+    '''
+    def __init__(self, client, fallback=None, threshold: float=confidence_threshold):
+        self.client=client
+        self.fallback=fallback
+        self.threshold=threshold
+        self.tool_sessions={}
+
+    async def _session_for(self, tool_name: str):
+        if tool_name not in self.tool_sessions:
+            sessions=self.client.get_all_active_sessions() or await self.client.create_all_sessions()
+            for session in sessions.values():
+                for tool in session.connector.tools:
+                    self.tool_sessions[tool.name]=session
+        return self.tool_sessions.get(tool_name)
+
+    async def call_tool(self, tool_name: str, arguments: dict)->dict:
+        '''
+        Output: the tool's structured result, read from the CallToolResult
+        '''
+        session=await self._session_for(tool_name)
+        if session is None:
+            return error_result(tool_name, arguments.get("question", arguments.get("input")), f"No MCP server provides the {tool_name} tool")
+        return from_call_result(await session.connector.call_tool(tool_name, arguments))
+
+    async def run(self, query: str, max_steps: int=10, session_id: str="default")->dict:
+        '''
+        Output: the tool's structured result, with the routing decision under "route".
+        The decision travels with the result rather than living on the dispatcher,
+        which is shared by every frontend session.
+        '''
+        start=time.time()
+        route, confidence=classify_question(query)
+        if confidence<self.threshold and self.fallback is not None:
+            decision={"route": route, "confidence": confidence, "via": "agent"}
+            log_decision(query, route, confidence, "agent", time.time()-start)
+            payload=await self.fallback.run(query=query, max_steps=max_steps, session_id=session_id)
+            return {**payload, "route": decision}
+
+        tool_name, argument=route_tools[route]
+        decision={"route": route, "confidence": confidence, "via": "direct", "tool": tool_name}
+        log_decision(query, route, confidence, "direct", time.time()-start)
+        try:
+            payload=await self.call_tool(tool_name, {argument: query, "session_id": session_id})
+        except Exception as e:
+            payload=error_result(tool_name, query, str(e))
+        return {**payload, "route": decision}
+
+class EventLoopThread:
+    '''
+    One event loop kept alive in a background thread, so MCP sessions opened during one
+    Streamlit rerun are still usable in the next instead of being tied to a closed loop.
+    '''
+    def __init__(self):
+        self.loop=asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def run(self, coroutine, timeout: float=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
@@ -1,48 +1,42 @@
 #MCP/elaboration_server/server.py
 
-import llama_cpp
+import time
 from mcp.server.fastmcp import FastMCP
-from ..state_manager import read_state, update_field, add_chat_entry, get_chat_history_text 
+from backend.query_result import format_for_prompt
+from ..inference_host import connect_to_host
+from ..inference_queue import inference_queue, QueueFullError
+from ..tool_results import Timer, tool_result, error_result
+from ..state_manager import read_field, update_field, add_chat_entry, get_chat_history_text, DEFAULT_SESSION
 
 mcp=FastMCP("Elaboration server")
-model_path=f"C:\\Users\\caio\\code\\maritime_report_generation\\models\\dolphin3.0-llama3.2-3b-q5_k_m.gguf"
 
-def load_model(path: str):
-    '''
-    Input: Model gguf Path
-    Output: initialised llm
-    '''
-    global llm
-    llm=llama_cpp.Llama(model_path=path, chat_format="llama-2", n_ctx=8192)
-    return llm
-
-print("Initialising model.")
-llm=load_model(model_path)
+print("Connecting to inference host.")
+llm=connect_to_host()
 print("Model ready for Analysis Generation.")
 
-@mcp.tool(description="A tool that takes previously queried data from sql and a previously generated report, and provides a deeper analysis according to the user-requested input.")
-def elaborate_on_response(input, report="", data="", history=""):
+def run_elaboration(input, report="", data="", history="", session_id=DEFAULT_SESSION):
     '''
-    elaborates on given information, and assigns it to input
+    elaborates on given information, and assigns it to input. Blocking, run on an inference queue worker.
     handles state["answer"] and updates state["chat_history"]
+    Output: structured tool result with the elaboration and timings
     '''
     try:
+        timer=Timer()
         llm.reset()
         print("Elaborating on given question")
 
-        state=read_state()
-
         if not report:
-            report = state.get("report", "")
+            report = read_field("report", session_id=session_id)
         if not data:
-            data = state.get("result", "")
+            data = read_field("result", session_id=session_id)
+        data=format_for_prompt(data)
         if not history:
-            history = get_chat_history_text()
+            history = get_chat_history_text(session_id)
         
         question=input
         context=report
         
-        update_field("query", question)
+        update_field("query", question, session_id=session_id)
 
         elaboration_prompt=f"""
         <|im_start|>system
@@ -65,28 +59,45 @@ def elaborate_on_response(input, report="", data="", history=""):
         temp=0.6
         max_tokens=250
 
+        started=time.perf_counter()
         response=llm.create_completion(
             prompt=elaboration_prompt,
             temperature=temp,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            slot=f"{session_id}:elaboration"
         )
+        timer.step("generation", started)
 
         result=response['choices'][0]['text']
         result=result.replace("[/INST]", "").replace("'''", "").strip()
 
-        update_field("elaboration", result)
+        update_field("elaboration", result, session_id=session_id)
 
-        add_chat_entry(question, result, "Elaboration")
+        add_chat_entry(question, result, "Elaboration", session_id=session_id)
 
         print("Finished Response Elaboration")
         llm.reset()
-        return result
+        return tool_result("elaborate_on_response", question, "elaboration", result, timings=timer.total())
     
     except Exception as e:
         error_msg = f"Error in elaboration: {str(e)}"
         print(error_msg)
-        add_chat_entry(input, error_msg, "Elaboration (Error)")
-        return error_msg
+        add_chat_entry(input, error_msg, "Elaboration (Error)", session_id=session_id)
+        return error_result("elaborate_on_response", input, error_msg)
+
+@mcp.tool(description="A tool that takes previously queried data from sql and a previously generated report, and provides a deeper analysis according to the user-requested input.")
+async def elaborate_on_response(input, report="", data="", history="", session_id: str=DEFAULT_SESSION)->dict:
+    try:
+        payload=await inference_queue.run(run_elaboration, input, report, data, history, session_id)
+        update_field("tool_result", payload, session_id=session_id)
+        return payload
+    except QueueFullError as e:
+        print(f"Rejected request, {e}")
+        return error_result("elaborate_on_response", input, str(e), status="busy")
+
+@mcp.tool(description="Reports how busy the elaboration server is: active and queued inference requests, rejections and wait times.")
+def elaboration_queue_status()->dict:
+    return inference_queue.metrics()
 
 if __name__ == "__main__":
     # Initialize and run the server
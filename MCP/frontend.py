@@ -1,7 +1,7 @@
 import streamlit as st
-import asyncio
 import json
 import traceback
+import uuid
 from datetime import datetime
 import sys
 import os
@@ -12,8 +12,10 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 try:
     from langchain_ollama import ChatOllama
     from langchain_community.chat_models import ChatLlamaCpp
-    from mcp_use import MCPAgent, MCPClient
+    from mcp_use import MCPClient
     from state_manager import read_state, clear_state
+    from tool_results import result_text
+    from dispatch import DirectDispatcher, SmartToolAgent, EventLoopThread
 except ImportError as e:
     st.error(f"Import error: {e}")
     st.stop()
@@ -22,83 +24,10 @@ except ImportError as e:
 MODEL_PATH = "C:\\Users\\caio\\code\\maritime_report_generation\\models\\dolphin3.0-llama3.2-3b-q5_k_m.gguf"
 CONFIG_PATH = "C:\\Users\\caio\\code\\maritime_report_generation\\MCP\\config.json"
 
-class ToolOutputExtractor:
-    @staticmethod
-    def extract_tool_result(agent_response: str) -> str:
-        try:
-            import re
-            
-            # Try to extract JSON first
-            json_matches = re.findall(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', agent_response, re.DOTALL)
-            
-            for json_match in json_matches:
-                try:
-                    parsed_json = json.loads(json_match)
-                    if any(key in parsed_json for key in ['report', 'result', 'output', 'response']):
-                        if 'report' in parsed_json:
-                            return parsed_json['report']
-                        elif 'result' in parsed_json:
-                            return parsed_json['result']
-                        elif 'output' in parsed_json:
-                            return parsed_json['output']
-                        elif 'response' in parsed_json:
-                            return parsed_json['response']
-                        else:
-                            return json.dumps(parsed_json, indent=2)
-                except json.JSONDecodeError:
-                    continue
-            
-            # Try to extract tool result pattern
-            tool_result_pattern = r'(?:Tool result:|Tool output:|Result:)\s*(.*?)(?:\n\n|$)'
-            tool_match = re.search(tool_result_pattern, agent_response, re.DOTALL | re.IGNORECASE)
-            if tool_match:
-                return tool_match.group(1).strip()
-            
-            # Return substantial blocks
-            lines = agent_response.split('\n')
-            substantial_blocks = []
-            current_block = []
-            
-            for line in lines:
-                if line.strip():
-                    current_block.append(line)
-                else:
-                    if current_block and len('\n'.join(current_block)) > 100:
-                        substantial_blocks.append('\n'.join(current_block))
-                    current_block = []
-            
-            if current_block and len('\n'.join(current_block)) > 100:
-                substantial_blocks.append('\n'.join(current_block))
-            
-            if substantial_blocks:
-                return substantial_blocks[-1]
-            
-            return agent_response
-            
-        except Exception as e:
-            st.error(f"Error extracting tool result: {e}")
-            return agent_response
-
-class SmartToolAgent:
-    def __init__(self, llm, client, max_steps=30, verbose=False):
-        self.agent = MCPAgent(llm=llm, client=client, max_steps=max_steps, verbose=verbose)
-        self.extractor = ToolOutputExtractor()
-
-    async def run(self, query: str, max_steps: int = 10) -> str:
-        enhanced_query = f"""
-        IMPORTANT: You are a tool executor. Your job is to:
-        1. Select the appropriate tool for this query.
-        2. Execute the tool with the correct parameters.
-        3. Return only the raw tool output without any additional commentary, analysis or interpretation.
-        Query: {query}
-        Do not add any summary, analysis or additional text. Just execute the tool and return its output directly.
-        """
-        try:
-            full_response = await self.agent.run(query=enhanced_query, max_steps=max_steps)
-            tool_output = self.extractor.extract_tool_result(full_response)
-            return tool_output
-        except Exception as e:
-            return f"Error executing tool: {str(e)}"
+@st.cache_resource
+def get_event_loop():
+    """One long-lived loop for all MCP calls, so sessions survive Streamlit reruns"""
+    return EventLoopThread()
 
 @st.cache_resource
 def initialize_agent():
@@ -119,7 +48,10 @@ def initialize_agent():
         
         agent = SmartToolAgent(llm=llm_agent, client=client, max_steps=30, verbose=True)
         
-        return agent, client, tools
+        # Confident routes call the tool directly; the agent only handles ambiguous questions
+        dispatcher = DirectDispatcher(client, fallback=agent)
+        
+        return dispatcher, client, tools
         
     except Exception as e:
         st.error(f"Failed to initialize agent: {e}")
@@ -138,10 +70,16 @@ def main():
     
     # Initialize agent
     agent, client, tools = initialize_agent()
+    event_loop = get_event_loop()
     
     if agent is None:
         st.stop()
     
+    # Each browser session keeps its own report, result and chat history in the state store
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    session_id = st.session_state.session_id
+    
     # Sidebar for tools and state
     with st.sidebar:
         st.header("🛠️ System Status")
@@ -160,13 +98,13 @@ def main():
             st.rerun()
         
         if st.button("🗑️ Clear State"):
-            clear_state()
+            clear_state(session_id)
             st.success("State cleared!")
             st.rerun()
         
         # Display current state
         try:
-            state = read_state()
+            state = read_state(session_id)
             st.subheader("Current State")
             
             if state.get("last_updated"):
@@ -205,14 +143,27 @@ def main():
             with st.spinner("Processing your request..."):
                 try:
                     # Run the agent
-                    response = asyncio.run(agent.run(query=prompt, max_steps=10))
+                    response = event_loop.run(agent.run(query=prompt, max_steps=10, session_id=session_id))
                     
                     # Display response
-                    if response:
-                        st.markdown(response)
+                    text = result_text(response) if response else ""
+                    if text:
+                        st.markdown(text)
+                        decision = response.get("route")
+                        if decision:
+                            st.caption(f"Route: {decision['route']} (confidence {decision['confidence']}), via {decision.get('tool', 'agent')}")
+                        details = {key: response[key] for key in ("sql_query", "result", "timings") if key in response}
+                        if details:
+                            with st.expander("Tool Details"):
+                                if "sql_query" in details:
+                                    st.code(details["sql_query"], language="sql")
+                                if "result" in details:
+                                    st.json(details["result"])
+                                if "timings" in details:
+                                    st.json(details["timings"])
                         
                         # Add assistant response to chat history
-                        st.session_state.messages.append({"role": "assistant", "content": response})
+                        st.session_state.messages.append({"role": "assistant", "content": text})
                     else:
                         error_msg = "No response generated. Please check your query and try again."
                         st.error(error_msg)
@@ -0,0 +1,97 @@
+#MCP/inference_benchmark.py
+
+import time
+import argparse
+import statistics
+import threading
+
+from .inference_host import RemoteLlama
+
+sql_prompt="""
+<|im_start|>system
+Given an input question, create a syntactically correct sqlite query to run to help find the answer.
+Only use the tables given in the schema description.
+###SCHEMA DESCRIPTION###
+CREATE TABLE "OTAS_data" (id INTEGER, name TEXT, latitude REAL, longitude REAL, speed REAL, course REAL, hostility TEXT, category TEXT, nationality TEXT, time TEXT)
+<|im_end|>
+<|im_start|>user
+Question: {question}
+<|im_end|>
+<|im_start|>assistant
+"""
+
+report_prompt="""
+<|im_start|>system
+Act as an experienced Indian military tactician creating a report.
+Explain it like someone who is a Indian naval commander, in crisp military parlance, structured in markdown.
+<|im_end|>
+<|im_start|>user
+Question: {question}
+<|im_end|>
+<|im_start|>assistant
+"""
+
+questions=[
+    "Give me information on all chinese vessels.",
+    "Which hostile submarines were reported near Porbandar?",
+    "List the aircraft inside Indian waters.",
+    "What has arnab reported today?"
+]
+
+def user_session(llm: RemoteLlama, user: int, requests: int, report_tokens: int, latencies: dict, errors: list):
+    '''
+    One simulated operator: every request is a short SQL completion followed by a streamed report.
+    '''
+    for i in range(requests):
+        question=questions[(user+i)%len(questions)]
+        try:
+            start=time.perf_counter()
+            llm.create_completion(prompt=sql_prompt.format(question=question), temperature=0.3, max_tokens=64, slot=f"user-{user}")
+            latencies["sql"].append(time.perf_counter()-start)
+
+            start=time.perf_counter()
+            for _ in llm.create_completion(prompt=report_prompt.format(question=question), temperature=0.5, max_tokens=report_tokens, stream=True, slot=f"user-{user}-report"):
+                pass
+            latencies["report"].append(time.perf_counter()-start)
+        except Exception as e:
+            errors.append(str(e))
+
+def run(users: int, requests: int, report_tokens: int)->dict:
+    llm=RemoteLlama()
+    latencies={"sql": [], "report": []}
+    errors=[]
+    threads=[threading.Thread(target=user_session, args=(llm, user, requests, report_tokens, latencies, errors)) for user in range(users)]
+    start=time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed=time.perf_counter()-start
+
+    completed=len(latencies["report"])
+    return {
+        "users": users,
+        "requests": completed,
+        "errors": len(errors),
+        "seconds": round(elapsed, 2),
+        "requests_per_minute": round(completed/elapsed*60, 2) if elapsed else 0.0,
+        "sql_p50_s": round(statistics.median(latencies["sql"]), 3) if latencies["sql"] else None,
+        "sql_max_s": round(max(latencies["sql"]), 3) if latencies["sql"] else None,
+        "report_p50_s": round(statistics.median(latencies["report"]), 3) if latencies["report"] else None
+    }
+
+def main():
+    parser=argparse.ArgumentParser(description="Measures inference host throughput with several simulated operators. Start the host first with 'python -m MCP.inference_host'.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=3, help="Requests per user, each a SQL completion and a streamed report")
+    parser.add_argument("--report-tokens", type=int, default=256)
+    args=parser.parse_args()
+
+    print(f"{'users':>5} {'requests':>8} {'errors':>6} {'seconds':>8} {'req/min':>8} {'sql p50':>8} {'sql max':>8} {'report p50':>10}")
+    for users in args.users:
+        r=run(users, args.requests, args.report_tokens)
+        print(f"{r['users']:>5} {r['requests']:>8} {r['errors']:>6} {r['seconds']:>8} {r['requests_per_minute']:>8} {r['sql_p50_s']!s:>8} {r['sql_max_s']!s:>8} {r['report_p50_s']!s:>10}")
+    print(RemoteLlama().status())
+
+if __name__=="__main__":
+    main()
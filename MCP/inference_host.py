@@ -0,0 +1,340 @@
+#MCP/inference_host.py
+
+import os
+import time
+import heapq
+import secrets
+import itertools
+import threading
+import traceback
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+model_path=f"C:\\Users\\caio\\code\\maritime_report_generation\\models\\dolphin3.0-llama3.2-3b-q5_k_m.gguf"
+
+HOST_ADDRESS=(os.environ.get("INFERENCE_HOST", "127.0.0.1"), int(os.environ.get("INFERENCE_PORT", "6010")))
+HOST_AUTHKEY_FILE=os.environ.get("INFERENCE_AUTHKEY_FILE", os.path.join(os.path.expanduser("~"), ".maritime_inference_authkey"))
+LOOPBACK_HOSTS={"127.0.0.1", "localhost", "::1"}
+
+SHORT_JOB_TOKENS=400
+MAX_KV_SLOTS=int(os.environ.get("INFERENCE_KV_SLOTS", "4"))
+
+class InferenceHostError(RuntimeError):
+    pass
+
+def load_authkey(create: bool=False)->bytes:
+    '''
+    Per-deployment secret shared by the host and the tool servers. Messages are pickled,
+    so anyone holding the key can run code in the host; it must never be a public default.
+    INFERENCE_AUTHKEY overrides the key file. Otherwise the host generates HOST_AUTHKEY_FILE
+    on first start, readable by its owner only, and clients read it.
+    '''
+    key=os.environ.get("INFERENCE_AUTHKEY")
+    if key:
+        if len(key)<32:
+            raise InferenceHostError("INFERENCE_AUTHKEY must be a random secret of at least 32 characters.")
+        return key.encode("utf-8")
+
+    try:
+        if os.name=="posix" and os.stat(HOST_AUTHKEY_FILE).st_mode & 0o077:
+            raise InferenceHostError(f"{HOST_AUTHKEY_FILE} is readable by other users, restrict it with 'chmod 600'.")
+        with open(HOST_AUTHKEY_FILE, "rb") as f:
+            key=f.read().strip()
+    except FileNotFoundError:
+        if not create:
+            raise InferenceHostError(f"No inference host key at {HOST_AUTHKEY_FILE}. Start the host with 'python -m MCP.inference_host' to generate it.") from None
+        key=secrets.token_hex(32).encode("utf-8")
+        fd=os.open(HOST_AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        print(f"Generated inference host key at {HOST_AUTHKEY_FILE}")
+    if not key:
+        raise InferenceHostError(f"{HOST_AUTHKEY_FILE} is empty, delete it and restart the host.")
+    return key
+
+def job_priority(max_tokens: int, stream: bool)->int:
+    '''
+    0 for short completions such as routing and SQL, 1 for long or streamed report decodes.
+    '''
+    return 0 if not stream and max_tokens<=SHORT_JOB_TOKENS else 1
+
+class RemoteLlama:
+    '''
+    Thin stand-in for llama_cpp.Llama used by the MCP tool servers.
+    Every completion is forwarded to the shared inference host over a local socket,
+    so the tool servers never load model weights themselves.
+    '''
+    def __init__(self, address=HOST_ADDRESS, authkey: bytes=None):
+        self.address=address
+        self.authkey=authkey
+
+    def _connect(self):
+        # read per connection, so tool servers may start before the host has generated the key
+        authkey=self.authkey or load_authkey()
+        try:
+            return Client(self.address, authkey=authkey)
+        except (ConnectionRefusedError, OSError) as e:
+            raise InferenceHostError(f"Inference host not reachable at {self.address[0]}:{self.address[1]}. Start it with 'python -m MCP.inference_host'. ({e})") from None
+
+    def _request(self, payload: dict)->dict:
+        with self._connect() as conn:
+            conn.send(payload)
+            reply=conn.recv()
+
+        if reply.get("status")!="ok":
+            raise InferenceHostError(reply.get("error", "Unknown inference host error"))
+        return reply
+
+    def _stream(self, payload: dict):
+        with self._connect() as conn:
+            conn.send(payload)
+            while True:
+                reply=conn.recv()
+                if reply.get("status")!="ok":
+                    raise InferenceHostError(reply.get("error", "Unknown inference host error"))
+                if reply.get("done"):
+                    return
+                yield reply["chunk"]
+
+    def reset(self):
+        # the host restores each caller's KV slot before every completion
+        return None
+
+    def create_completion(self, prompt: str, temperature: float=0.8, max_tokens: int=16, stream: bool=False, priority: int=None, slot: str=None, **kwargs):
+        '''
+        Same contract as llama_cpp.Llama.create_completion:
+        a response dict, or an iterator of chunk dicts when stream=True.
+        priority overrides the host's short/long classification (lower runs first),
+        slot names the KV snapshot the host restores for this caller.
+        '''
+        payload={
+            "op": "complete",
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+            "kwargs": kwargs
+        }
+        if priority is not None:
+            payload["priority"]=priority
+        if slot is not None:
+            payload["slot"]=slot
+        if stream:
+            return self._stream(payload)
+        return self._request(payload)["response"]
+
+    def ping(self)->dict:
+        return self._request({"op": "ping"})
+
+    def status(self)->dict:
+        '''
+        Output: host queue depth, slots, preemptions and mean wait and run times
+        '''
+        return self._request({"op": "status"})
+
+def connect_to_host()->RemoteLlama:
+    '''
+    Output: client for the shared inference host.
+    Only warns if the host is down, so tool servers can still start first.
+    '''
+    llm=RemoteLlama()
+    try:
+        info=llm.ping()
+        print(f"Connected to inference host, model: {info.get('model')}")
+    except InferenceHostError as e:
+        print(f"Warning: {e}")
+    return llm
+
+class Job:
+    def __init__(self, request: dict, conn=None):
+        self.request=request
+        self.conn=conn
+        self.stream=bool(request.get("stream"))
+        self.priority=request.get("priority", job_priority(request.get("max_tokens", 16), self.stream))
+        self.slot=request.get("slot") or ("short" if self.priority==0 else "long")
+        self.submitted=time.monotonic()
+        self.done=threading.Event()
+        self.response=None
+        self.error=None
+
+class InferenceHost:
+    '''
+    Loads the gguf model once and serves completions to every MCP tool server.
+    llama.cpp contexts are not thread safe, so a single scheduler thread runs all jobs:
+    - jobs wait in a priority heap, short completions (router, SQL) ahead of report decodes
+    - a streaming decode is paused between tokens while shorter jobs are waiting,
+      its KV state saved and restored afterwards
+    - each slot (a session or job kind) keeps a KV snapshot, so interleaved callers
+      resume from their own prompt prefix instead of re-evaluating it
+    '''
+    def __init__(self, path: str, address=HOST_ADDRESS, authkey: bytes=None, max_slots: int=MAX_KV_SLOTS):
+        import llama_cpp
+
+        if address[0] not in LOOPBACK_HOSTS and os.environ.get("INFERENCE_ALLOW_REMOTE")!="1":
+            raise InferenceHostError(f"Refusing to listen on {address[0]}: peers send pickled requests, so the host only binds to loopback. Set INFERENCE_ALLOW_REMOTE=1 to override.")
+        authkey=authkey or load_authkey(create=True)
+
+        print("Loading model")
+        self.path=path
+        self.llm=llama_cpp.Llama(model_path=path, chat_format="llama-2", n_ctx=8192)
+        self.max_slots=max_slots
+        self.slots=OrderedDict()
+        self.current_slot=None
+        self.pending=[]
+        self.sequence=itertools.count()
+        self.condition=threading.Condition()
+        self.stats={"completed": 0, "failed": 0, "preemptions": 0, "slot_restores": 0, "wait_seconds": 0.0, "run_seconds": 0.0}
+        self.listener=Listener(address, authkey=authkey, backlog=64)
+        threading.Thread(target=self.schedule_forever, daemon=True).start()
+        print(f"Inference host listening on {address[0]}:{address[1]}")
+
+    def submit(self, job: Job)->Job:
+        with self.condition:
+            heapq.heappush(self.pending, (job.priority, next(self.sequence), job))
+            self.condition.notify()
+        return job
+
+    def _next_job(self, below: int=None):
+        '''
+        Pops the most urgent job; with below set, only one more urgent than that priority.
+        '''
+        with self.condition:
+            if below is None:
+                while not self.pending:
+                    self.condition.wait()
+            elif not self.pending or self.pending[0][0]>=below:
+                return None
+            return heapq.heappop(self.pending)[2]
+
+    def _switch_slot(self, slot, state=None):
+        '''
+        Parks the current slot's KV snapshot and restores slot's, or state when given.
+        '''
+        if slot==self.current_slot and state is None:
+            return
+        if self.current_slot is not None and self.current_slot!=slot:
+            self.slots[self.current_slot]=self.llm.save_state()
+            self.slots.move_to_end(self.current_slot)
+            while len(self.slots)>self.max_slots:
+                self.slots.popitem(last=False)
+        state=state if state is not None else self.slots.get(slot)
+        if state is not None:
+            self.llm.load_state(state)
+            self.stats["slot_restores"]+=1
+        self.current_slot=slot
+
+    def _completion(self, job: Job):
+        request=job.request
+        return self.llm.create_completion(
+            prompt=request["prompt"],
+            temperature=request["temperature"],
+            max_tokens=request["max_tokens"],
+            stream=job.stream,
+            **request.get("kwargs", {})
+        )
+
+    def run_job(self, job: Job):
+        started=time.monotonic()
+        self.stats["wait_seconds"]+=started-job.submitted
+        try:
+            self._switch_slot(job.slot)
+            if not job.stream:
+                job.response=self._completion(job)
+            else:
+                for chunk in self._completion(job):
+                    job.conn.send({"status": "ok", "chunk": chunk})
+                    self._yield_to_waiting(job)
+                job.conn.send({"status": "ok", "done": True})
+            self.stats["completed"]+=1
+        except Exception as e:
+            traceback.print_exc()
+            job.error=str(e)
+            self.stats["failed"]+=1
+            # the context may hold a half-evaluated prompt, start the slot again from scratch
+            self.llm.reset()
+            self.slots.pop(job.slot, None)
+            self.current_slot=None
+        finally:
+            self.stats["run_seconds"]+=time.monotonic()-started
+            job.done.set()
+
+    def _yield_to_waiting(self, job: Job):
+        '''
+        Runs every waiting job more urgent than job before its next token is decoded.
+        '''
+        urgent=self._next_job(below=job.priority)
+        if urgent is None:
+            return
+        self.stats["preemptions"]+=1
+        paused=self.llm.save_state()
+        # generate() replaces the model's sampler and load_state does not bring it back,
+        # so the paused decode would otherwise continue with the last urgent job's sampling settings
+        sampler=getattr(self.llm, "_sampler", None)
+        # the paused decode is restored from its own snapshot, not parked in the slot table
+        self.current_slot=None
+        while urgent is not None:
+            self.run_job(urgent)
+            urgent=self._next_job(below=job.priority)
+        self._switch_slot(job.slot, paused)
+        if sampler is not None:
+            self.llm._sampler=sampler
+
+    def schedule_forever(self):
+        while True:
+            self.run_job(self._next_job())
+
+    def status(self)->dict:
+        with self.condition:
+            queued=[priority for priority, _, _ in self.pending]
+        finished=self.stats["completed"]+self.stats["failed"]
+        return {
+            "model": os.path.basename(self.path),
+            "queued": len(queued),
+            "queued_short": queued.count(0),
+            "slots": list(self.slots),
+            **{key: value for key, value in self.stats.items() if not key.endswith("_seconds")},
+            "mean_wait_ms": round(self.stats["wait_seconds"]/finished*1000, 1) if finished else 0.0,
+            "mean_run_ms": round(self.stats["run_seconds"]/finished*1000, 1) if finished else 0.0
+        }
+
+    def handle(self, conn):
+        with conn:
+            try:
+                request=conn.recv()
+                op=request.get("op")
+                if op=="ping":
+                    conn.send({"status": "ok", "model": os.path.basename(self.path)})
+                elif op=="status":
+                    conn.send({"status": "ok", **self.status()})
+                elif op=="complete":
+                    job=self.submit(Job(request, conn))
+                    job.done.wait()
+                    if job.error is not None:
+                        conn.send({"status": "error", "error": job.error})
+                    elif not job.stream:
+                        conn.send({"status": "ok", "response": job.response})
+                else:
+                    conn.send({"status": "error", "error": f"Unknown operation {op}"})
+            except EOFError:
+                pass
+            except Exception as e:
+                traceback.print_exc()
+                try:
+                    conn.send({"status": "error", "error": str(e)})
+                except OSError:
+                    pass
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn=self.listener.accept()
+            except (EOFError, OSError, AuthenticationError) as e:
+                # a caller that hangs up or fails the handshake must not stop the host
+                print(f"Rejected connection: {e!r}")
+                continue
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+if __name__=="__main__":
+    host=InferenceHost(os.environ.get("MODEL_PATH", model_path))
+    host.serve_forever()
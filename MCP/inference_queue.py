@@ -0,0 +1,119 @@
+#MCP/inference_queue.py
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+INFERENCE_WORKERS=int(os.environ.get("INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_SIZE=int(os.environ.get("INFERENCE_QUEUE_SIZE", "8"))
+
+class QueueFullError(RuntimeError):
+    pass
+
+_done=object()
+
+class InferenceQueue:
+    '''
+    Runs the blocking part of a tool call (SQL generation, query execution, decoding) on a
+    small pool of worker threads, so the FastMCP event loop keeps answering quick tools.
+    At most max_pending jobs wait behind the workers; further calls are refused with
+    QueueFullError instead of piling up behind a long report.
+    '''
+    def __init__(self, workers: int=INFERENCE_WORKERS, max_pending: int=INFERENCE_QUEUE_SIZE):
+        self.workers=workers
+        self.max_pending=max_pending
+        self.executor=ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self.lock=threading.Lock()
+        self.admitted=0
+        self.active=0
+        self.completed=0
+        self.failed=0
+        self.rejected=0
+        self.total_wait=0.0
+        self.max_wait=0.0
+        self.total_run=0.0
+
+    def _admit(self):
+        with self.lock:
+            if self.admitted>=self.workers+self.max_pending:
+                self.rejected+=1
+                raise QueueFullError(f"Inference queue is full ({self.max_pending} requests waiting), try again shortly")
+            self.admitted+=1
+
+    def _job(self, fn, args, kwargs, submitted: float):
+        started=time.monotonic()
+        with self.lock:
+            self.active+=1
+            self.total_wait+=started-submitted
+            self.max_wait=max(self.max_wait, started-submitted)
+        failed=False
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            failed=True
+            raise
+        finally:
+            with self.lock:
+                self.active-=1
+                self.admitted-=1
+                self.total_run+=time.monotonic()-started
+                if failed:
+                    self.failed+=1
+                else:
+                    self.completed+=1
+
+    def submit(self, fn, *args, **kwargs):
+        '''
+        Output: concurrent.futures.Future for fn(*args, **kwargs); raises QueueFullError when full
+        '''
+        self._admit()
+        return self.executor.submit(self._job, fn, args, kwargs, time.monotonic())
+
+    async def run(self, fn, *args, **kwargs):
+        '''
+        Awaits fn(*args, **kwargs) on a worker thread.
+        '''
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def stream(self, generator_fn, *args, **kwargs):
+        '''
+        Iterates generator_fn(*args, **kwargs) on a worker thread, handing each item
+        to the event loop as soon as it is produced.
+        '''
+        loop=asyncio.get_running_loop()
+        items=asyncio.Queue()
+
+        def drain():
+            try:
+                for item in generator_fn(*args, **kwargs):
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+            finally:
+                loop.call_soon_threadsafe(items.put_nowait, _done)
+
+        future=asyncio.wrap_future(self.submit(drain))
+        while True:
+            item=await items.get()
+            if item is _done:
+                break
+            yield item
+        await future
+
+    def metrics(self)->dict:
+        with self.lock:
+            finished=self.completed+self.failed
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "active": self.active,
+                "queued": self.admitted-self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "mean_wait_ms": round(self.total_wait/finished*1000, 1) if finished else 0.0,
+                "max_wait_ms": round(self.max_wait*1000, 1),
+                "mean_run_ms": round(self.total_run/finished*1000, 1) if finished else 0.0
+            }
+
+inference_queue=InferenceQueue()
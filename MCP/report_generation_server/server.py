@@ -1,44 +1,49 @@
 #MCP/report_generation/server.py
 
-import llama_cpp
 from datetime import datetime
-from mcp.server.fastmcp import FastMCP
-import json
-from langchain_community.utilities import SQLDatabase
-from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
+from mcp.server.fastmcp import FastMCP, Context
 import re
 
-from ..state_manager import read_state, update_field, add_chat_entry
+from backend.database import get_database
+from backend.index_advisor import record_query
+from backend.query_result import is_error
+from backend.track_stats import summarise_tracks
+from backend.sql_cache import SQLCache
+from backend.result_cache import result_cache, database_path
+from backend.schema_catalog import get_catalog
+from ..inference_host import connect_to_host
+from ..inference_queue import inference_queue, QueueFullError
+from ..tool_results import Timer, tool_result, error_result
+import time
+from ..state_manager import update_field, add_chat_entry, DEFAULT_SESSION
 
 dialect="sqlite"
 mcp=FastMCP("Report Generation")
-model_path=f"C:\\Users\\caio\\code\\maritime_report_generation\\models\\dolphin3.0-llama3.2-3b-q5_k_m.gguf"
 
 def assign_db():
     '''
-    handles state["db"] and state["db_info"]
-    Assigns database to be used
+    Assigns database to be used, building its schema catalog ahead of the first request
     '''
-    sqlite_db=SQLDatabase.from_uri("sqlite:///../../sql_files/myDataBase.db")
-    sqlite_info=sqlite_db.get_table_info()
-    return sqlite_db, sqlite_info
+    sqlite_db=get_database()
+    get_catalog(database_path(sqlite_db))
+    return sqlite_db
 
-def load_model(path: str):
-    '''
-    Input: Model gguf Path
-    Output: initialised llm
-    '''
-    global llm
-    llm=llama_cpp.Llama(model_path=path, chat_format="llama-2", n_ctx=8192)
-    return llm
-
-print("Initialising model.")
-llm=load_model(model_path)
+print("Connecting to inference host.")
+llm=connect_to_host()
 print("Model ready for SQL communication and report Generation.")
-db, db_info=assign_db()
+db=assign_db()
 print("Datbase Ready.")
+sql_cache=SQLCache()
+
+def write_sql_query(question: str, session_id: str=DEFAULT_SESSION):
+    # fetched per request, so value lists follow new data and a schema change clears the SQL cache
+    catalog=get_catalog(database_path(db))
+    db_info=catalog.table_info(question)
+    sql_cache.set_schema(catalog.schema_signature())
+    cached_query=sql_cache.lookup(question)
+    if cached_query:
+        return cached_query
 
-def write_sql_query(question: str, db_info: str):
     llm.reset()
     top_k=5
 
@@ -52,15 +57,14 @@ def write_sql_query(question: str, db_info: str):
     Never query for all the columns from a specific table, only ask for a the few relevant columns given the question. Generate only one query.
     Pay attention to use only the column names, and their values that you can see in the schema description. Be careful to not query for columns that do not exist. Also, pay attention to which column is in which table.
     Prefer structured filters using equality.
-    Only use the following tables:
-    {db_info}
-
-    ###SCHEMA DESCRIPTION###
-    {db_info}
+    Only use the tables given in the schema description.
 
     ###USER FEEDBACK###
     You should avoid fuzzy pattern matching with LIKE '%chinese%' unless strictly necessary.
     You should not generate multiple queries.
+
+    ###SCHEMA DESCRIPTION###
+    {db_info}
     
     <|im_end|>
     <|im_start|>user
@@ -74,7 +78,8 @@ def write_sql_query(question: str, db_info: str):
     response=llm.create_completion(
         prompt=prompt_template,
         temperature=temp,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        slot=f"{session_id}:sql"
     )
 
     result=response['choices'][0]['text']
@@ -90,41 +95,48 @@ def write_sql_query(question: str, db_info: str):
 
 def execute_query(query: str, db)->str:
     '''
-    Runs SQL query on server and returns relevant tuples as a reponse.
+    Runs SQL query on server and returns the matching rows as a columnar result.
     handles state["result"]
     '''
     print("Executing query")
-    execute_query_tool=QuerySQLDataBaseTool(db=db)
-    result=execute_query_tool.invoke(query)
+    db_path=database_path(db)
+    result=result_cache.get(db_path, query)
+    if result is not None:
+        print(f"Query result served from cache, {result_cache.stats()}")
+        return result
+    version=result_cache.version(db_path)
+    result=db.execute(query)
+    if not is_error(result):
+        result_cache.put(db_path, query, result, version)
     return result
 
-def report_generation(question, result):
+def stream_report(question, result, session_id=DEFAULT_SESSION):
     '''
-    Generates reports.
-    handles state["report"] and updates state["chat_history]
+    Generates reports, yielding text as it is decoded.
     '''
     llm.reset()
     print("Generating Report")
     question=question
-    context=result
+    context=summarise_tracks(result)
     time=datetime.now().strftime("%d-%m-%y %H:%M:%S")
     prompt_template=f"""
     <|im_start|>system
-    Act as an experienced Indian military tactician creating a report using {context}.
+    Act as an experienced Indian military tactician creating a report using the provided context.
     Explain it like someone who is a Indian naval commander.
-    Using the given {context}, answer the {question} in a precise manner using crisp military parlance.
-    Ensure that the answer contains information from the provided {context}.
-    The goal is to identify patterns in the {context} and relay necessary information.
+    Using the given context, answer the question in a precise manner using crisp military parlance.
+    Ensure that the answer contains information from the provided context.
+    The goal is to identify patterns in the context and relay necessary information.
     It should be a concise report, consisting of all the necessary information, highlighting patterns in data.
 
-    You will be given a list of column labels, an explaination on what each label means, and then the {context}, which is a list of data tuples.
-    Each element in the data tuple, corresponds to the column label at the same position.
+    You will be given an explaination on what each column label means, and then the context.
+    The context starts with statistics computed per target over all matching rows: speed range, course volatility, range, altitude and depth trends, time span and border crossings. Base movement patterns on these.
+    It ends with sample rows as a table, whose first line lists the column labels, and each following line is one row with values separated by |.
 
     If the answer on the question is not in the provided context, tell the user, you can't answer the question on basis of the available data.
     Structure your response in markdown.
-    Include Report Generation Time and date {time} in the report.
+    Include the Report Generation Time and date given with the context in the report.
 
-    #column labels
+    #available column labels
     id, name, latitude, longitude, range, bearing, course, speed, altitude, depth, reported_by, comment, hostility, category, nationality, location_wrt_naval_borders, closest_point_of_mil_interest, time, location
 
     #explaination of each label
@@ -203,6 +215,10 @@ def report_generation(question, result):
     **CONCLUSION:**
     The Rafale (ID 2001) is engaging in what appears to be standard operational flights, likely training or specialized reconnaissance, within authorized Indian airspace. The Erratic movements and variable speeds are characteristic of advanced aerial exercises. Continued monitoring is advised to confirm operational intent and detect any deviation from expected friendly patterns.
 
+    ###Context:
+    {context}
+
+    Report Generation Time and date: {time}
     <|im_end|>
     <|im_start|>user
     Question: {question}
@@ -213,54 +229,87 @@ def report_generation(question, result):
     temp=0.5
     max_tokens=1500
 
-    response=llm.create_completion(
+    for chunk in llm.create_completion(
         prompt=prompt_template,
         temperature=temp,
-        max_tokens=max_tokens
-    )
-
-    result=response['choices'][0]['text']
-    result=result.replace("[/INST]", "").strip()
+        max_tokens=max_tokens,
+        stream=True,
+        slot=f"{session_id}:report"
+    ):
+        yield chunk['choices'][0]['text']
     llm.reset()
-    return result
-    
-@mcp.tool(description="A tool that takes natural language questions as input, generates relevant sql queries, executes them, and generates a report.")
-async def generate_report(question: str)->str:
-    try:    
-        print(f"Processing Question {question}")
-        update_field("query", question)
 
-        query=write_sql_query(question, db_info)
-        print(f"Sql query written->\n\n {query}")
-        update_field("sql_query", query)
+def run_report(question, session_id=DEFAULT_SESSION, details=None):
+    '''
+    Blocking report pipeline, run on an inference queue worker.
+    Writes and executes the SQL, then yields report text as it is decoded.
+    details, when given, receives the SQL, the query result and step timings.
+    handles state["query"], state["sql_query"], state["result"] and state["report"]
+    '''
+    details=details if details is not None else {}
+    timer=Timer()
+    print(f"Processing Question {question}")
+    update_field("query", question, session_id=session_id)
+
+    started=time.perf_counter()
+    query=write_sql_query(question, session_id)
+    timer.step("sql_generation", started)
+    record_query(query)
+    print(f"Sql query written->\n\n {query}")
+    update_field("sql_query", query, session_id=session_id)
+    details["sql_query"]=query
+
+    started=time.perf_counter()
+    result=execute_query(query, db)
+    timer.step("query", started)
+    print(f"Executed query, received response->\n\n {result}")
+    update_field("result", result, session_id=session_id)
+    details["result"]=result
+    if not is_error(result):
+        sql_cache.store(question, query)
+
+    started=time.perf_counter()
+    tokens=[]
+    for token in stream_report(question, result, session_id):
+        tokens.append(token)
+        yield token
+    timer.step("generation", started)
+    details["timings"]=timer.total()
+    report="".join(tokens).replace("[/INST]", "").strip()
+    if report:
+        update_field("report", report, session_id=session_id)
+        print(f"Created Report.")
 
-        result=execute_query(query, db)
-        print(f"Executed query, received response->\n\n {result}")
-        update_field("result", result)
+@mcp.tool(description="A tool that takes natural language questions as input, generates relevant sql queries, executes them, and generates a report.")
+async def generate_report(question: str, ctx: Context, session_id: str=DEFAULT_SESSION)->dict:
+    try:
+        tokens=[]
+        details={}
+        async for token in inference_queue.stream(run_report, question, session_id, details):
+            tokens.append(token)
+            await ctx.info(token)
+        report="".join(tokens).replace("[/INST]", "").strip()
 
-        report=report_generation(question, result)
         if report:
-            report_generated=True
-            update_field("report", report)
-            print(f"Created Report.")
-        else:
-            report_generated=False
-
-        if report_generated:
-            return report
+            payload=tool_result("generate_report", question, "report", report, details.get("sql_query"), details.get("result"), details.get("timings"))
+            update_field("tool_result", payload, session_id=session_id)
+            return payload
         else:
             error_msg = "Report not generated."
-            add_chat_entry(question, error_msg, "Report Generation (Error)")
-            return error_msg
+            add_chat_entry(question, error_msg, "Report Generation (Error)", session_id=session_id)
+            return error_result("generate_report", question, error_msg)
+
+    except QueueFullError as e:
+        print(f"Rejected request, {e}")
+        return error_result("generate_report", question, str(e), status="busy")
 
     except Exception as e:
-        error_response={
-            "question": question,
-            "error": str(e),
-            "status": "error"
-        }
         print(f"Error processing request, {e}")
-        return json.dumps(error_response, indent=2)
+        return error_result("generate_report", question, str(e))
+
+@mcp.tool(description="Reports how busy the report generation server is: active and queued inference requests, rejections and wait times.")
+def report_queue_status()->dict:
+    return inference_queue.metrics()
 
 if __name__ == "__main__":
     # Initialize and run the server
@@ -2,56 +2,217 @@
 
 import json
 import os
+import sqlite3
+import threading
+import time
 from datetime import datetime
 
-STATE_FILE="mcp_state.json"
+STATE_DIR=os.path.dirname(os.path.abspath(__file__))
+STATE_DB=os.path.join(STATE_DIR, "mcp_state.db")
+LEGACY_STATE_FILE=os.path.join(STATE_DIR, "mcp_state.json")
+MAX_CHAT_ENTRIES=5
 
-def write_state(state):
+DEFAULT_SESSION="default"
+SESSION_TTL_SECONDS=float(os.environ.get("MCP_SESSION_TTL", 4*60*60))
+MAX_SESSION_BYTES=int(os.environ.get("MCP_SESSION_MAX_BYTES", 8*1024*1024))
+EVICTION_INTERVAL_SECONDS=60
+
+DEFAULT_STATE={
+    "query": "",
+    "sql_query": "",
+    "result": "",
+    "report": "",
+    "analysis": "",
+    "elaboration": "",
+    "chat_history": [],
+    "last_updated": ""
+}
+
+class StateLimitError(ValueError):
+    pass
+
+_local=threading.local()
+_last_eviction=0.0
+
+def _connection()->sqlite3.Connection:
+    '''
+    One connection per thread and process. Every field of every session is its own row, so an
+    update rewrites only that field, and WAL with a busy timeout serialises the servers' writes.
+    '''
+    conn=getattr(_local, "conn", None)
+    if conn is not None and _local.pid==os.getpid():
+        return conn
+
+    conn=sqlite3.connect(STATE_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS fields (session_id TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (session_id, field))")
+    conn.execute("CREATE TABLE IF NOT EXISTS chat_entries (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, entry TEXT NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_entries_session ON chat_entries (session_id, id)")
+    _local.conn=conn
+    _local.pid=os.getpid()
+    _import_legacy_state(conn)
+    return conn
+
+def _import_legacy_state(conn):
+    '''
+    Carries state from before sessions existed into the default session: the single-session
+    state and chat_history tables, or mcp_state.json.
+    '''
+    tables={name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    if "state" in tables:
+        with _transaction(conn):
+            now=time.time()
+            conn.execute("INSERT OR IGNORE INTO sessions (session_id, last_seen) VALUES (?, ?)", (DEFAULT_SESSION, now))
+            conn.execute("INSERT OR IGNORE INTO fields (session_id, field, value, updated_at) SELECT ?, field, value, ? FROM state", (DEFAULT_SESSION, now))
+            conn.execute("INSERT INTO chat_entries (session_id, entry) SELECT ?, entry FROM chat_history ORDER BY id", (DEFAULT_SESSION,))
+            conn.execute("DROP TABLE state")
+            conn.execute("DROP TABLE chat_history")
+        return
+
+    if not os.path.exists(LEGACY_STATE_FILE) or conn.execute("SELECT 1 FROM fields LIMIT 1").fetchone():
+        return
     try:
-        with open(STATE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(state, f, indent=2, ensure_ascii=False)
-    except Exception as e:
+        with open(LEGACY_STATE_FILE, 'r', encoding='utf-8') as f:
+            legacy=json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"Could not import {LEGACY_STATE_FILE}: {e}")
+        return
+    write_state(legacy)
+
+class _transaction:
+    '''
+    BEGIN IMMEDIATE takes the write lock up front, so read-modify-write sequences
+    from different processes cannot interleave. Reads use DEFERRED for a consistent snapshot.
+    '''
+    def __init__(self, conn, mode="IMMEDIATE"):
+        self.conn=conn
+        self.mode=mode
+
+    def __enter__(self):
+        self.conn.execute(f"BEGIN {self.mode}")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+def _evict_expired(conn, now: float):
+    global _last_eviction
+    if now-_last_eviction<EVICTION_INTERVAL_SECONDS:
+        return
+    _last_eviction=now
+    expired=[session_id for (session_id,) in conn.execute("SELECT session_id FROM sessions WHERE last_seen<?", (now-SESSION_TTL_SECONDS,))]
+    for session_id in expired:
+        _delete_session(conn, session_id)
+    if expired:
+        print(f"Evicted {len(expired)} idle state sessions")
+
+def _delete_session(conn, session_id):
+    conn.execute("DELETE FROM fields WHERE session_id=?", (session_id,))
+    conn.execute("DELETE FROM chat_entries WHERE session_id=?", (session_id,))
+    conn.execute("DELETE FROM sessions WHERE session_id=?", (session_id,))
+
+def _touch(conn, session_id):
+    now=time.time()
+    conn.execute("INSERT INTO sessions (session_id, last_seen) VALUES (?, ?) ON CONFLICT(session_id) DO UPDATE SET last_seen=excluded.last_seen", (session_id, now))
+    _evict_expired(conn, now)
+
+def _set(conn, session_id, field_name, value):
+    conn.execute(
+        "INSERT INTO fields (session_id, field, value, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(session_id, field) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
+        (session_id, field_name, json.dumps(value, ensure_ascii=False), time.time())
+    )
+
+def _session_bytes(conn, session_id)->int:
+    fields=conn.execute("SELECT COALESCE(SUM(LENGTH(CAST(value AS BLOB))), 0) FROM fields WHERE session_id=?", (session_id,)).fetchone()[0]
+    chat=conn.execute("SELECT COALESCE(SUM(LENGTH(CAST(entry AS BLOB))), 0) FROM chat_entries WHERE session_id=?", (session_id,)).fetchone()[0]
+    return fields+chat
+
+def _enforce_limit(conn, session_id, keep_field=None):
+    '''
+    Drops the session's oldest chat entries, then its least recently updated fields,
+    until it fits MAX_SESSION_BYTES. The newest chat entry, keep_field and last_updated
+    are kept; if they alone exceed the limit the write is refused instead.
+    '''
+    kept=[field for field in (keep_field, "last_updated") if field is not None]
+    while _session_bytes(conn, session_id)>MAX_SESSION_BYTES:
+        oldest_entry=conn.execute(
+            "SELECT id FROM chat_entries WHERE session_id=? AND id<(SELECT MAX(id) FROM chat_entries WHERE session_id=?) ORDER BY id LIMIT 1",
+            (session_id, session_id)
+        ).fetchone()
+        if oldest_entry is not None:
+            conn.execute("DELETE FROM chat_entries WHERE id=?", (oldest_entry[0],))
+            continue
+
+        oldest_field=conn.execute(
+            f"SELECT field FROM fields WHERE session_id=? AND field NOT IN ({', '.join('?'*len(kept))}) ORDER BY updated_at LIMIT 1",
+            (session_id, *kept)
+        ).fetchone()
+        if oldest_field is None:
+            raise StateLimitError(f"{keep_field or 'the latest chat entry'} exceeds the {MAX_SESSION_BYTES} byte state limit of session {session_id}")
+        conn.execute("DELETE FROM fields WHERE session_id=? AND field=?", (session_id, oldest_field[0]))
+
+def _chat_history(conn, session_id)->list:
+    return [json.loads(entry) for (entry,) in conn.execute("SELECT entry FROM chat_entries WHERE session_id=? ORDER BY id", (session_id,))]
+
+def write_state(state, session_id=DEFAULT_SESSION):
+    try:
+        conn=_connection()
+        with _transaction(conn):
+            _touch(conn, session_id)
+            for field_name, value in state.items():
+                if field_name=="chat_history":
+                    conn.execute("DELETE FROM chat_entries WHERE session_id=?", (session_id,))
+                    for entry in value[-MAX_CHAT_ENTRIES:]:
+                        conn.execute("INSERT INTO chat_entries (session_id, entry) VALUES (?, ?)", (session_id, json.dumps(entry, ensure_ascii=False)))
+                else:
+                    _set(conn, session_id, field_name, value)
+            _enforce_limit(conn, session_id)
+    except (sqlite3.Error, StateLimitError) as e:
         print(f"Error writing state: {e}")
 
-def read_state():
-    if not os.path.exists(STATE_FILE):
-        default_state={
-            "query": "",
-            "sql_query": "",
-            "result": "",
-            "report": "",
-            "analysis": "",
-            "elaboration": "",
-            "chat_history": [],
-            "last_updated": ""
-        }
-        write_state(default_state)
-        return default_state
+def read_state(session_id=DEFAULT_SESSION):
+    try:
+        conn=_connection()
+        with _transaction(conn, "DEFERRED"):
+            state=dict(DEFAULT_STATE)
+            state.update({field_name: json.loads(value) for field_name, value in conn.execute("SELECT field, value FROM fields WHERE session_id=?", (session_id,))})
+            state["chat_history"]=_chat_history(conn, session_id)
+        return state
+    except sqlite3.Error as e:
+        print(f"Error reading state: {e}")
+        return dict(DEFAULT_STATE, chat_history=[])
+
+def read_field(field_name, default=None, session_id=DEFAULT_SESSION):
+    '''
+    Reads one field without loading the others, e.g. the report without the query result.
+    '''
+    try:
+        conn=_connection()
+        if field_name=="chat_history":
+            return _chat_history(conn, session_id)
+        row=conn.execute("SELECT value FROM fields WHERE session_id=? AND field=?", (session_id, field_name)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Error reading state: {e}")
+        row=None
+    if row is None:
+        return DEFAULT_STATE.get(field_name, "") if default is None else default
+    return json.loads(row[0])
 
+def update_field(field_name, value, session_id=DEFAULT_SESSION):
     try:
-        with open(STATE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {
-            "query": "",
-            "sql_query": "",
-            "result": "",
-            "report": "",
-            "analysis": "",
-            "elaboration": "",
-            "chat_history": [],
-            "last_updated": ""
-        }
-
-def update_field(field_name, value):
-    state=read_state()
-    state[field_name]=value
-    state["last_updated"]=datetime.now().isoformat()
-    write_state(state)
-
-def add_chat_entry(user_input, response, tool_used):
-    state=read_state()
+        conn=_connection()
+        with _transaction(conn):
+            _touch(conn, session_id)
+            _set(conn, session_id, field_name, value)
+            _set(conn, session_id, "last_updated", datetime.now().isoformat())
+            _enforce_limit(conn, session_id, field_name)
+    except (sqlite3.Error, StateLimitError) as e:
+        print(f"Error writing state: {e}")
 
+def add_chat_entry(user_input, response, tool_used, session_id=DEFAULT_SESSION):
     new_entry={
         "timestamp":datetime.now().isoformat(),
         "user_input":user_input,
@@ -59,32 +220,45 @@ def add_chat_entry(user_input, response, tool_used):
         "tool_used":tool_used
     }
 
-    state["chat_history"].append(new_entry)
-
-    if len(state["chat_history"])>5:
-        state["chat_history"]=state["chat_history"][-5:]
-
-    state["last_updated"]=datetime.now().isoformat()
-    write_state(state)
+    try:
+        conn=_connection()
+        with _transaction(conn):
+            _touch(conn, session_id)
+            conn.execute("INSERT INTO chat_entries (session_id, entry) VALUES (?, ?)", (session_id, json.dumps(new_entry, ensure_ascii=False)))
+            conn.execute(
+                "DELETE FROM chat_entries WHERE session_id=? AND id NOT IN (SELECT id FROM chat_entries WHERE session_id=? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, MAX_CHAT_ENTRIES)
+            )
+            _set(conn, session_id, "last_updated", datetime.now().isoformat())
+            _enforce_limit(conn, session_id)
+    except (sqlite3.Error, StateLimitError) as e:
+        print(f"Error writing state: {e}")
 
-def get_chat_history_text():
-    state=read_state()
+def get_chat_history_text(session_id=DEFAULT_SESSION):
     history_text=""
-    for entry in state["chat_history"]:
+    for entry in read_field("chat_history", session_id=session_id):
         history_text += f"User: {entry['user_input']}\n"
         history_text += f"Assistant ({entry['tool_used']}): {entry['response']}\n"
         history_text += f"Time: {entry['timestamp']}\n\n"
     return history_text
 
-def clear_state():
-    default_state={
-        "query": "",
-        "sql_query": "",
-        "result": "",
-        "report": "",
-        "analysis": "",
-        "elaboration": "",
-        "chat_history": [],
-        "last_updated": datetime.now().isoformat()
+def clear_state(session_id=DEFAULT_SESSION):
+    try:
+        conn=_connection()
+        with _transaction(conn):
+            conn.execute("DELETE FROM fields WHERE session_id=?", (session_id,))
+            conn.execute("DELETE FROM chat_entries WHERE session_id=?", (session_id,))
+            _touch(conn, session_id)
+            _set(conn, session_id, "last_updated", datetime.now().isoformat())
+    except sqlite3.Error as e:
+        print(f"Error writing state: {e}")
+
+def session_usage():
+    '''
+    Output: {session_id: {"bytes", "last_seen"}} for every live session
+    '''
+    conn=_connection()
+    return {
+        session_id: {"bytes": _session_bytes(conn, session_id), "last_seen": last_seen}
+        for session_id, last_seen in conn.execute("SELECT session_id, last_seen FROM sessions").fetchall()
     }
-    write_state(default_state)
\ No newline at end of file
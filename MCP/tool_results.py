@@ -0,0 +1,81 @@
+#MCP/tool_results.py
+
+import json
+import time
+
+# field holding the text answer of each tool
+text_fields=("report", "analysis", "elaboration")
+
+class Timer:
+    '''
+    Collects named step durations for a tool result, e.g. sql_generation, query, generation.
+    '''
+    def __init__(self):
+        self.started=time.perf_counter()
+        self.timings={}
+
+    def step(self, name: str, started: float):
+        self.timings[f"{name}_seconds"]=round(time.perf_counter()-started, 3)
+
+    def total(self)->dict:
+        return {**self.timings, "total_seconds": round(time.perf_counter()-self.started, 3)}
+
+def result_metadata(result)->dict:
+    '''
+    Output: shape of a columnar query result, without its rows
+    '''
+    if not isinstance(result, dict):
+        return {}
+    metadata={key: result[key] for key in ("columns", "row_count", "truncated") if key in result}
+    if "error" in result:
+        metadata["error"]=result["error"]
+    return metadata
+
+def tool_result(tool: str, question: str, text_field: str, text: str, sql_query: str=None, result=None, timings: dict=None)->dict:
+    '''
+    Structured tool output: the answer text under text_field, plus the SQL, result shape and step timings.
+    '''
+    payload={"status": "ok", "tool": tool, "question": question, text_field: text}
+    if sql_query is not None:
+        payload["sql_query"]=sql_query
+    if result is not None:
+        payload["result"]=result_metadata(result)
+    if timings:
+        payload["timings"]=timings
+    return payload
+
+def error_result(tool: str, question: str, error: str, status: str="error")->dict:
+    return {"status": status, "tool": tool, "question": question, "error": error}
+
+def from_call_result(call_result)->dict:
+    '''
+    Input: mcp CallToolResult
+    Output: the tool's dict, from structuredContent when the server sends it, otherwise from its JSON text
+    '''
+    structured=getattr(call_result, "structuredContent", None)
+    if isinstance(structured, dict):
+        # FastMCP wraps non-object return types as {"result": ...}
+        return structured.get("result", structured) if set(structured)=={"result"} else structured
+
+    text="".join(content.text for content in call_result.content if getattr(content, "type", "")=="text")
+    try:
+        payload=json.loads(text)
+    except json.JSONDecodeError:
+        payload=None
+    if not isinstance(payload, dict):
+        payload={"status": "ok", "tool": None, "response": text}
+    if getattr(call_result, "isError", False):
+        payload["status"]="error"
+        payload["error"]=text
+    return payload
+
+def result_text(payload: dict)->str:
+    '''
+    Output: the text to show the user for a structured tool result
+    '''
+    if payload.get("status")!="ok":
+        return f"Error executing tool: {payload.get('error', 'unknown error')}"
+    for field in text_fields+("response",):
+        if payload.get(field):
+            return payload[field]
+    return json.dumps(payload, indent=2)
@@ -0,0 +1,130 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .query_result import to_columnar, error_result
+from .metrics import metrics
+
+default_db_path=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql_files", "myDataBase.db")
+
+class QueryTimeout(RuntimeError):
+    pass
+
+class Database:
+    '''
+    Pool of read-only sqlite connections shared by the backend graph and the MCP servers.
+    Connections open the file with mode=ro and query_only, use large page and mmap caches,
+    keep their prepared statements cached, and interrupt queries that run past the timeout.
+    '''
+    dialect="sqlite"
+
+    def __init__(self, path: str=default_db_path, pool_size: int=4, timeout: float=10.0, cache_size_kib: int=65536, mmap_size: int=256*1024*1024, cached_statements: int=256):
+        self.path=os.path.abspath(path)
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Database not found at {self.path}")
+        self.timeout=timeout
+        self.cache_size_kib=cache_size_kib
+        self.mmap_size=mmap_size
+        self.cached_statements=cached_statements
+        self._enable_wal()
+        self.pool=queue.LifoQueue()
+        for _ in range(pool_size):
+            self.pool.put(self._connect())
+
+    def _enable_wal(self):
+        '''
+        WAL lets readers keep going while an ingest writes. The mode is stored in the file,
+        so one read-write connection is enough; read-only deployments keep their journal mode.
+        '''
+        try:
+            conn=sqlite3.connect(self.path, timeout=self.timeout)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+        except sqlite3.OperationalError as e:
+            print(f"Could not switch database to WAL mode: {e}")
+
+    def _connect(self)->sqlite3.Connection:
+        conn=sqlite3.connect(
+            f"file:{self.path}?mode=ro",
+            uri=True,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.execute(f"PRAGMA cache_size=-{self.cache_size_kib}")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        conn.execute("PRAGMA query_only=1")
+        return conn
+
+    @contextmanager
+    def connection(self, timeout: float=None):
+        '''
+        Borrows a pooled connection; queries on it are interrupted after timeout seconds.
+        '''
+        timeout=timeout or self.timeout
+        try:
+            conn=self.pool.get(timeout=timeout)
+        except queue.Empty:
+            raise QueryTimeout(f"No database connection free within {timeout} seconds") from None
+
+        deadline=time.monotonic()+timeout
+        conn.set_progress_handler(lambda: 1 if time.monotonic()>deadline else 0, 10000)
+        try:
+            yield conn
+        finally:
+            conn.set_progress_handler(None, 0)
+            if conn.in_transaction:
+                conn.rollback()
+            self.pool.put(conn)
+
+    def run(self, query: str, parameters=(), timeout: float=None, max_rows: int=None):
+        '''
+        Input: SQL query and optional parameters, optional row limit
+        Output: (column names, list of row tuples), with at most max_rows+1 rows so callers can tell it was cut
+        '''
+        timeout=timeout or self.timeout
+        started=time.perf_counter()
+        with self.connection(timeout) as conn:
+            try:
+                cursor=conn.execute(query, parameters)
+                rows=cursor.fetchall() if max_rows is None else cursor.fetchmany(max_rows+1)
+            except sqlite3.OperationalError as e:
+                if "interrupted" in str(e):
+                    raise QueryTimeout(f"Query exceeded {timeout} seconds") from None
+                raise
+            finally:
+                metrics.record_sql(time.perf_counter()-started)
+            columns=[description[0] for description in cursor.description or []]
+        return columns, rows
+
+    def execute(self, query: str, timeout: float=None, max_rows: int=1000)->dict:
+        '''
+        Output: columnar result from backend.query_result, carrying an "error" key on failure
+        '''
+        try:
+            columns, rows=self.run(query, timeout=timeout, max_rows=max_rows)
+        except (sqlite3.Error, QueryTimeout) as e:
+            return error_result(str(e))
+        return to_columnar(columns, rows, max_rows)
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+
+databases={}
+databases_lock=threading.Lock()
+
+def get_database(path: str=default_db_path)->Database:
+    '''
+    Output: the process-wide pool for path
+    '''
+    path=os.path.abspath(path)
+    with databases_lock:
+        if path not in databases:
+            databases[path]=Database(path)
+        return databases[path]
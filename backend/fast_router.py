@@ -0,0 +1,80 @@
+import re
+import json
+import time
+from functools import lru_cache
+
+ROUTES=("report", "analysis", "general")
+
+# below this the LLM router is asked instead
+confidence_threshold=0.6
+router_log_file="router_decisions.jsonl"
+
+# (pattern, weight) pairs scored against the lower-cased question
+route_patterns={
+    "report": [
+        (re.compile(r"\b(generate|create|make|prepare|produce|draft|write|compile|give me)\b.*\b(report|sitrep)s?\b"), 3.0),
+        (re.compile(r"\b(report|sitrep)s?\b"), 2.0),
+        (re.compile(r"\b(brief|briefing|summari[sz]e|summary)\b"), 1.0),
+    ],
+    "analysis": [
+        (re.compile(r"\b(analy[sz]e|analysis|elaborate|explain|assess|assessment|implications?|insights?|interpret)\b"), 2.0),
+        (re.compile(r"\b(why|deeper|more detail|in detail|expand on|tell me more)\b"), 1.5),
+        (re.compile(r"\b(previous|last|above|earlier|that|this|the) (report|answer|response)\b"), 2.0),
+    ],
+    "general": [
+        (re.compile(r"^(what|which|who|where|when|how many|how much|list|show|find|get|is|are|does|do)\b"), 1.5),
+        (re.compile(r"\b(all|count|number of|any|currently|latest)\b"), 0.5),
+    ],
+}
+
+def normalise_question(question: str)->str:
+    return " ".join(re.findall(r"[a-z0-9']+", question.lower()))
+
+@lru_cache(maxsize=1024)
+def _classify(normalised: str):
+    scores={route: 0.0 for route in ROUTES}
+    for route, patterns in route_patterns.items():
+        for pattern, weight in patterns:
+            if pattern.search(normalised):
+                scores[route]+=weight
+
+    route=max(scores, key=scores.get)
+    total=sum(scores.values())
+    if total==0:
+        return "general", 0.0
+    # the +1 keeps a single weak keyword from looking certain
+    confidence=scores[route]/(total+1.0)
+    return route, round(confidence, 3)
+
+def classify_question(question: str):
+    '''
+    Input: user question
+    Output: (route, confidence between 0 and 1)
+    '''
+    return _classify(normalise_question(question))
+
+def normalise_route(text: str)->str:
+    '''
+    Maps free text LLM router output onto one of the graph's route labels.
+    '''
+    text=text.lower()
+    positions={route: text.find(route) for route in ROUTES if route in text}
+    if not positions:
+        return "general"
+    return min(positions, key=positions.get)
+
+def log_decision(question: str, route: str, confidence: float, source: str, seconds: float):
+    print(f"Router decision: {route} (confidence {confidence}, via {source}, {seconds*1000:.2f} ms)")
+    entry={
+        "timestamp": time.time(),
+        "question": question,
+        "route": route,
+        "confidence": confidence,
+        "source": source,
+        "seconds": seconds
+    }
+    try:
+        with open(router_log_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False)+"\n")
+    except OSError as e:
+        print(f"Could not write router log: {e}")
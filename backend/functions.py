@@ -1,18 +1,27 @@
 import os
-from langchain_community.utilities import SQLDatabase
-from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
 from langchain import hub
-import llama_cpp
 from typing import TypedDict, Dict, List
 from typing_extensions import Annotated
 from langgraph.graph import StateGraph, START
+from langgraph.config import get_stream_writer
 from datetime import datetime
 import re
-import markdown
-import pdfkit
-import tempfile
-
-llm=None
+from .prompt_cache import PrefixCache
+from .model_manager import model_manager
+from .sql_cache import SQLCache
+from .result_cache import result_cache, database_path
+from .schema_catalog import get_catalog
+from .database import Database, get_database
+from .index_advisor import record_query
+from .query_result import format_for_prompt, is_error
+from .track_stats import summarise_tracks
+from .naval_letter import format_naval_letter, render_letter_pdf, render_text_pdf
+from .fast_router import classify_question, normalise_route, log_decision, confidence_threshold
+import time
+
+prompt_cache=PrefixCache(lock=model_manager.inference_lock)
+model_manager.add_unload_listener(prompt_cache.clear)
+sql_cache=SQLCache()
 no_of_messages_retained=10
 
 class State(TypedDict):
@@ -20,12 +29,12 @@ class State(TypedDict):
 
     query: str
 
-    result: str
+    result: Dict
 
     report: str
     answer: str
 
-    db: SQLDatabase
+    db: Database
     db_info: str
 
     route: str
@@ -33,17 +42,13 @@ class State(TypedDict):
     report_question: str
     chat_history: List[Dict[str, str]]
 
-def load_model(path: str):
+def load_model(path: str, **options):
     '''
-    Input: Model gguf Path
-    Output: initialised llm
+    Input: Model gguf Path, optional model manager options
+    Output: initialised llm, shared by every caller in the process
     '''
-    print("---------------------------------\n\n")
-    print("Loading model")
-    print("---------------------------------\n\n")
-    global llm
-    llm=llama_cpp.Llama(model_path=path, chat_format="llama-2", n_ctx=8192)
-    return llm
+    model_manager.configure(path, **options)
+    return model_manager.get()
 
 def assign_db(state: State)->State:
     '''
@@ -53,8 +58,9 @@ def assign_db(state: State)->State:
     print("---------------------------------\n\n")
     print("Assigning Database")
     print("---------------------------------\n\n")
-    sqlite_db=SQLDatabase.from_uri("sqlite:///sql_files/myDataBase.db")
-    sqlite_info=sqlite_db.get_table_info()
+    sqlite_db=get_database()
+    # reflected once per database file change, not on every request
+    sqlite_info=get_catalog(database_path(sqlite_db)).table_info()
     print("succesful assignment")
     print(sqlite_db)
     print(sqlite_info)
@@ -70,13 +76,21 @@ def assign_db(state: State)->State:
 def router(state: State)->State:
     '''
     Decides what is to be done with user query, and assigns relevant route
+    Uses the keyword router first, and only asks the LLM when it is unsure
     handles state["route"]
     '''
     print("Routing action to be taken")
     question=state["question"]
-    llm.reset()
+    start=time.time()
+    route, confidence=classify_question(question)
+    if confidence>=confidence_threshold:
+        state["route"]=route
+        log_decision(question, route, confidence, "fast", time.time()-start)
+        return state
+
+    llm=model_manager.get()
     print("Initialised answer")
-    routing_prompt=f"""
+    system_prompt="""
     <|im_start|>system
     You are a general-purpose AI that helps people with questions.
 
@@ -88,15 +102,18 @@ def router(state: State)->State:
 
     <|im_end|>
     <|im_start|>user
-    Question: {question}
+    """
+    user_prompt=f"""Question: {question}
     <|im_end|>
     <|im_start|>assistant
     """
     temp=0.5
     max_tokens=100
     print("Creating response")
-    response=llm.create_completion(
-        prompt=routing_prompt,
+    response=prompt_cache.complete(
+        llm,
+        system_prompt,
+        user_prompt,
         temperature=temp,
         max_tokens=max_tokens
     )
@@ -106,19 +123,28 @@ def router(state: State)->State:
     print("---------------------------------\n\n")
     print(result)
     print("---------------------------------\n\n")
-    state["route"]=result
+    state["route"]=normalise_route(result)
+    log_decision(question, state["route"], confidence, "llm", time.time()-start)
     print("finished routing")
-    llm.reset()
     return state
 
 def write_sql_query(state: State)->State:
-    llm.reset()
     dialect=state["db"].dialect
     top_k=5
-    table_info=state["db_info"]
     input=state["question"]
+    catalog=get_catalog(database_path(state["db"]))
+    table_info=catalog.table_info(input)
+
+    sql_cache.set_schema(catalog.schema_signature())
+    cached_query=sql_cache.lookup(input)
+    if cached_query:
+        state["query"]=cached_query
+        record_query(cached_query)
+        return state
 
-    prompt_template=f"""
+    llm=model_manager.get()
+
+    system_prompt=f"""
     <|im_start|>system
 
     ###TASK###
@@ -128,16 +154,15 @@ def write_sql_query(state: State)->State:
     Never query for all the columns from a specific table, only ask for a the few relevant columns given the question. Generate only one query.
     Pay attention to use only the column names, and their values that you can see in the schema description. Be careful to not query for columns that do not exist. Also, pay attention to which column is in which table.
     Prefer structured filters using equality.
-    Only use the following tables:
-    {table_info}
-
-    ###SCHEMA DESCRIPTION###
-    {table_info}
+    Only use the tables given in the schema description.
 
     ###USER FEEDBACK###
     You should avoid fuzzy pattern matching with LIKE '%chinese%' unless strictly necessary.
     You should not generate multiple queries.
     
+    """
+    user_prompt=f"""###SCHEMA DESCRIPTION###
+    {table_info}
     <|im_end|>
     <|im_start|>user
     Question: {input}
@@ -148,8 +173,10 @@ def write_sql_query(state: State)->State:
     temp=0.3
     max_tokens=300
 
-    response=llm.create_completion(
-        prompt=prompt_template,
+    response=prompt_cache.complete(
+        llm,
+        system_prompt,
+        user_prompt,
         temperature=temp,
         max_tokens=max_tokens
     )
@@ -164,7 +191,7 @@ def write_sql_query(state: State)->State:
     result=result.lower()
     state["query"]=result
     state["question"]=input
-    llm.reset()
+    record_query(result)
     print("---------------------------------\n\n")
     print(state["query"])
     print("---------------------------------\n\n")
@@ -174,12 +201,21 @@ def write_sql_query(state: State)->State:
 def execute_query(state: State):
     '''
     Runs SQL query on server and returns relevant tuples as a reponse.
-    handles state["result"]
+    handles state["result"], as a columnar result from backend.query_result
     '''
     print("Executing query")
-    execute_query_tool=QuerySQLDataBaseTool(db=state["db"])
-    result=execute_query_tool.invoke(state["query"])
+    db_path=database_path(state["db"])
+    result=result_cache.get(db_path, state["query"])
+    if result is None:
+        version=result_cache.version(db_path)
+        result=state["db"].execute(state["query"])
+        if not is_error(result):
+            result_cache.put(db_path, state["query"], result, version)
+    else:
+        print("Query result served from cache")
     state["result"]=result
+    if not is_error(result):
+        sql_cache.store(state["question"], state["query"])
     print("---------------------------------\n\n")
     print(state["result"])
     print("---------------------------------\n\n")
@@ -191,28 +227,29 @@ def report_generation(state: State)->State:
     Generates reports.
     handles state["report"] and updates state["chat_history]
     '''
-    llm.reset()
     print("Generating Report")
+    llm=model_manager.get()
     question=state["question"]
-    context=state["result"]
+    context=summarise_tracks(state["result"])
     time=datetime.now().strftime("%d-%m-%y %H:%M:%S")
-    prompt_template=f"""
+    system_prompt="""
     <|im_start|>system
-    Act as an experienced Indian military tactician creating a report using {context}.
+    Act as an experienced Indian military tactician creating a report using the provided context.
     Explain it like someone who is a Indian naval commander.
-    Using the given {context}, answer the {question} in a precise manner using crisp military parlance.
-    Ensure that the answer contains information from the provided {context}.
-    The goal is to identify patterns in the {context} and relay necessary information.
+    Using the given context, answer the question in a precise manner using crisp military parlance.
+    Ensure that the answer contains information from the provided context.
+    The goal is to identify patterns in the context and relay necessary information.
     It should be a concise report, consisting of all the necessary information, highlighting patterns in data.
 
-    You will be given a list of column labels, an explaination on what each label means, and then the {context}, which is a list of data tuples.
-    Each element in the data tuple, corresponds to the column label at the same position.
+    You will be given an explaination on what each column label means, and then the context.
+    The context starts with statistics computed per target over all matching rows: speed range, course volatility, range, altitude and depth trends, time span and border crossings. Base movement patterns on these.
+    It ends with sample rows as a table, whose first line lists the column labels, and each following line is one row with values separated by |.
 
     If the answer on the question is not in the provided context, tell the user, you can't answer the question on basis of the available data.
     Structure your response in markdown.
-    Include Report Generation Time and date {time} in the report.
+    Include the Report Generation Time and date given with the context in the report.
 
-    #column labels
+    #available column labels
     id, name, latitude, longitude, range, bearing, course, speed, altitude, depth, reported_by, comment, hostility, category, nationality, location_wrt_naval_borders, closest_point_of_mil_interest, time, location
 
     #explaination of each label
@@ -291,6 +328,11 @@ def report_generation(state: State)->State:
     **CONCLUSION:**
     The Rafale (ID 2001) is engaging in what appears to be standard operational flights, likely training or specialized reconnaissance, within authorized Indian airspace. The Erratic movements and variable speeds are characteristic of advanced aerial exercises. Continued monitoring is advised to confirm operational intent and detect any deviation from expected friendly patterns.
 
+    """
+    user_prompt=f"""###Context:
+    {context}
+
+    Report Generation Time and date: {time}
     <|im_end|>
     <|im_start|>user
     Question: {question}
@@ -301,13 +343,22 @@ def report_generation(state: State)->State:
     temp=0.5
     max_tokens=1500
 
-    response=llm.create_completion(
-        prompt=prompt_template,
+    # tokens are pushed to app.stream(..., stream_mode="custom") callers as they are decoded
+    writer=get_stream_writer()
+    tokens=[]
+    for chunk in prompt_cache.complete(
+        llm,
+        system_prompt,
+        user_prompt,
         temperature=temp,
-        max_tokens=max_tokens
-    )
-
-    result=response['choices'][0]['text']
+        max_tokens=max_tokens,
+        stream=True
+    ):
+        token=chunk['choices'][0]['text']
+        tokens.append(token)
+        writer({"report_token": token})
+
+    result="".join(tokens)
     result=result.replace("[/INST]", "").strip()
     
     state["report"]=result
@@ -315,7 +366,6 @@ def report_generation(state: State)->State:
     state["question"]=question
     state["report_question"]=question
     print("Finished report generation")
-    llm.reset()
     return state
 
 def elaborate_on_response(state: State)->State:
@@ -323,18 +373,22 @@ def elaborate_on_response(state: State)->State:
     elaborates on given information, and assigns it to input
     handles state["answer"] and updates state["chat_history"]
     '''
-    llm.reset()
     print("Elaborating on given question")
+    llm=model_manager.get()
     question=state["question"]
     context=state["report"]
-    data=state["result"]
+    data=format_for_prompt(state["result"])
 
-    elaboration_prompt=f"""
+    system_prompt="""
     <|im_start|>system
     Act as an experienced Indian military tactician.
     Explain it like someone who is a Indian naval commander.
-    Answer the user's {question} using the given {context} and {data} in military parlance.
+    Answer the user's question using the given context and data in military parlance.
     Enclose the responses with '''.
+
+    """
+    user_prompt=f"""context: {context}
+    data: {data}
     <|im_end|>
     <|im_start|>user
     Question: {question}
@@ -344,8 +398,10 @@ def elaborate_on_response(state: State)->State:
     temp=0.6
     max_tokens=250
 
-    response=llm.create_completion(
-        prompt=elaboration_prompt,
+    response=prompt_cache.complete(
+        llm,
+        system_prompt,
+        user_prompt,
         temperature=temp,
         max_tokens=max_tokens
     )
@@ -355,7 +411,6 @@ def elaborate_on_response(state: State)->State:
 
     state["answer"]=result
     print("Finished Response Elaboration")
-    llm.reset()
     return state
 
 def update_chat_history(state: State)->State:
@@ -378,11 +433,12 @@ def update_chat_history(state: State)->State:
     return state
 
 def convert_report_to_pdf(state: State):
+    llm=model_manager.get()
     report=state["report"]
-    report_conversion_prompt=f"""
+    system_prompt="""
     <|im_start|>system
     Act as a report formatter, responsible for converting text into a proper format.
-    The task is to format the user given {report} into the proper format as shown below.
+    The task is to format the user given report into the proper format as shown below.
     The output should be in the correct format as shown in the below examples.
     Ensure that the output adheres to the provided format.
     Make minimal changes to the actual information in the content, but encapsulate it in the below provided format.
@@ -498,15 +554,18 @@ def convert_report_to_pdf(state: State):
     '''''
     <|im_end|>
     <|im_start|>user
-    Report: {report}
+    """
+    user_prompt=f"""Report: {report}
     <|im_end|>
     <|im_start|>assistant
     """
     temp=0.5
     max_tokens=1024
 
-    response=llm.create_completion(
-        prompt=report_conversion_prompt,
+    response=prompt_cache.complete(
+        llm,
+        system_prompt,
+        user_prompt,
         temperature=temp,
         max_tokens=max_tokens
     )
@@ -516,63 +575,29 @@ def convert_report_to_pdf(state: State):
     
     return result
 
-def pdf_result(state, file_path: str = "generated_report.pdf") -> bytes:
-    formatted_report=convert_report_to_pdf(state)
-    formatted_report=formatted_report.replace("*", "").replace("```", "")
-    temp_html_file_path = None
-    temp_pdf_file_path = None
-
-    try:
-        html_content = markdown.markdown(formatted_report)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".html", mode="w", encoding="utf-8") as tmp_html:
-            tmp_html.write(html_content)
-            temp_html_file_path = tmp_html.name
-        print(f"Temporary HTML file created: {temp_html_file_path}")
-
-        if file_path:
-            # If user wants to save to a specific file, use that path
-            output_pdf_actual_path = file_path
-            return_bytes = False
-        else:
-                # If user wants bytes, create another temporary file for PDF output
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", mode="wb") as tmp_pdf:
-                temp_pdf_file_path = tmp_pdf.name
-            output_pdf_actual_path = temp_pdf_file_path
-            return_bytes = True
-
-        print(f"PDF output path for wkhtmltopdf: {output_pdf_actual_path}")
-        
-        pdfkit.from_file(temp_html_file_path, output_pdf_actual_path)
-        print(f"PDF generated by pdfkit successfully at: {os.path.abspath(output_pdf_actual_path)}")
-
-        if return_bytes:
-            # Read the generated PDF file into bytes
-            with open(output_pdf_actual_path, "rb") as f:
-                pdf_bytes = f.read()
-            return pdf_bytes
-        else:
-            # PDF was saved to disk, return None as per function signature
-            return None
-
-    except FileNotFoundError:
-        # This specific error usually means wkhtmltopdf is not found
-        error_msg = "Error: 'wkhtmltopdf' executable not found. Please ensure it's installed and in your system PATH."
-        print(error_msg)
-        raise RuntimeError(error_msg) from None # Re-raise for Streamlit to catch
-    except Exception as e:
-        print(f"An error occurred during PDF generation: {e}")
-        import traceback
-        traceback.print_exc() # Print full traceback for debugging
-        raise # Re-raise the exception to be caught by Streamlit's try/except
-    finally:
-        # Clean up temporary files
-        if temp_html_file_path and os.path.exists(temp_html_file_path):
-            os.remove(temp_html_file_path)
-            print(f"Cleaned up temporary HTML file: {temp_html_file_path}")
-        if temp_pdf_file_path and os.path.exists(temp_pdf_file_path):
-            os.remove(temp_pdf_file_path)
-            print(f"Cleaned up temporary PDF file: {temp_pdf_file_path}")
+def pdf_result(state, file_path: str = "generated_report.pdf", llm_format: bool = False) -> bytes:
+    '''
+    Renders the report as a naval letter PDF in process.
+    The markdown report is mapped onto the letter layout deterministically; llm_format=True
+    runs the slower model reformatting pass first and renders its text as laid out.
+    Output: PDF bytes when file_path is None, otherwise the PDF is written there and None returned
+    '''
+    start=time.time()
+    if llm_format:
+        formatted_report=convert_report_to_pdf(state)
+        formatted_report=formatted_report.replace("*", "").replace("```", "")
+        pdf_bytes=render_text_pdf(formatted_report)
+    else:
+        letter=format_naval_letter(state["report"], question=state.get("report_question") or state.get("question"))
+        pdf_bytes=render_letter_pdf(letter)
+    print(f"PDF rendered in {(time.time()-start)*1000:.1f} ms")
+
+    if file_path:
+        with open(file_path, "wb") as f:
+            f.write(pdf_bytes)
+        print(f"PDF saved at: {os.path.abspath(file_path)}")
+        return None
+    return pdf_bytes
 
 def general_response(state: State):
     return
\ No newline at end of file
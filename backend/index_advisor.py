@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import statistics
+import threading
+from collections import Counter
+
+from .database import default_db_path
+
+query_log_path=os.path.join(os.path.dirname(default_db_path), "generated_queries.jsonl")
+log_lock=threading.Lock()
+
+equality_operators={"=", "==", "in", "is"}
+range_operators={"<", ">", "<=", ">=", "between"}
+
+predicate_pattern=re.compile(r"(?:\b[a-z_][a-z0-9_]*\.)?\b([a-z_][a-z0-9_]*)\s*(==|<=|>=|=|<|>|\bin\b|\bbetween\b|\bis\b(?!\s+not\b))")
+clause_end=r"(?:\bgroup\s+by\b|\border\s+by\b|\blimit\b|\bhaving\b|\bunion\b|$)"
+
+def record_query(query: str):
+    '''
+    Appends a generated SQL query to the log the advisor analyses.
+    '''
+    entry={"timestamp": time.time(), "query": query}
+    with log_lock:
+        try:
+            os.makedirs(os.path.dirname(query_log_path), exist_ok=True)
+            with open(query_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False)+"\n")
+        except OSError as e:
+            print(f"Could not record query for index advisor: {e}")
+
+def is_read_only(query: str)->bool:
+    '''
+    True for a single SELECT or WITH statement. The log holds every generated statement,
+    including ones the read-only pool refused, so nothing else is ever replayed.
+    '''
+    sql=re.sub(r"'(?:[^']|'')*'", "?", query)
+    sql=re.sub(r"--[^\n]*|/\*.*?\*/", " ", sql, flags=re.DOTALL).strip().rstrip(";").strip()
+    if ";" in sql or re.match(r"(?i)(select|with)\b", sql) is None:
+        return False
+    # WITH may still lead into a write
+    return re.search(r"(?i)\b(insert|update|delete|replace|create|drop|alter|attach|detach|pragma|vacuum)\b", sql) is None
+
+def read_only_connection(db_path: str):
+    conn=sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+def load_queries(path: str=query_log_path)->list:
+    if not os.path.exists(path):
+        return []
+    queries=[]
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                query=json.loads(line)["query"]
+            except (json.JSONDecodeError, KeyError):
+                continue
+            if is_read_only(query):
+                queries.append(query)
+    return queries
+
+def table_columns(conn)->dict:
+    tables={}
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"):
+        tables[table.lower()]=(table, [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')])
+    return tables
+
+def existing_indexes(conn, table: str)->list:
+    '''
+    Output: column lists of the indexes already on table
+    '''
+    indexes=[]
+    for row in conn.execute(f'PRAGMA index_list("{table}")'):
+        indexes.append([info[2] for info in conn.execute(f'PRAGMA index_info("{row[1]}")')])
+    return indexes
+
+def extract_predicates(query: str, tables: dict):
+    '''
+    Input: SQL query, output of table_columns
+    Output: (table name, equality columns, range columns, order by columns), or None for
+    queries the advisor does not understand, such as joins.
+    '''
+    sql=re.sub(r"'(?:[^']|'')*'", "?", query.lower())
+    from_tables=re.findall(r"\bfrom\s+\"?([a-z_][a-z0-9_]*)\"?", sql)
+    if len(set(from_tables))!=1 or " join " in sql or from_tables[0] not in tables:
+        return None
+    table, columns=tables[from_tables[0]]
+    known={column.lower(): column for column in columns}
+
+    equality, ranges, order=[], [], []
+    where=re.search(rf"\bwhere\b(.*?){clause_end}", sql, re.DOTALL)
+    if where:
+        for column, operator in predicate_pattern.findall(where.group(1)):
+            if column not in known:
+                continue
+            target=equality if operator in equality_operators else ranges if operator in range_operators else None
+            if target is not None and known[column] not in target:
+                target.append(known[column])
+
+    order_by=re.search(rf"\border\s+by\b(.*?)(?:\blimit\b|$)", sql, re.DOTALL)
+    if order_by:
+        for term in order_by.group(1).split(","):
+            column=term.strip().split(" ")[0].split(".")[-1].strip('"')
+            if column in known and known[column] not in order:
+                order.append(known[column])
+    return table, equality, ranges, order
+
+def candidate_index(equality: list, ranges: list, order: list)->tuple:
+    '''
+    Equality columns first, then at most one range or ordering column, which is
+    the longest prefix SQLite can use from a single index.
+    '''
+    columns=sorted(equality)
+    tail=ranges[:1] or [column for column in order[:1] if column not in columns]
+    return tuple(columns+tail)
+
+def is_covered(columns: tuple, indexes: list)->bool:
+    return any(tuple(index[:len(columns)])==columns for index in indexes)
+
+def explain(conn, query: str)->list:
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+
+def uses_full_scan(plan: list)->bool:
+    return any(step.startswith("SCAN") and "USING" not in step for step in plan)
+
+def time_query(conn, query: str, repeats: int=5)->float:
+    timings=[]
+    for _ in range(repeats):
+        start=time.perf_counter()
+        conn.execute(query).fetchall()
+        timings.append(time.perf_counter()-start)
+    return statistics.median(timings)
+
+def index_name(table: str, columns: tuple)->str:
+    return f"idx_{table.lower()}_{'_'.join(c.lower() for c in columns)}"
+
+def advise(db_path: str=default_db_path, queries: list=None, min_count: int=1)->list:
+    '''
+    Input: database path, queries (defaults to the generated query log), minimum number of queries an index must serve
+    Output: recommendations ordered by how many logged full-scan queries they would serve
+    '''
+    queries=load_queries() if queries is None else [query for query in queries if is_read_only(query)]
+    conn=read_only_connection(db_path)
+    try:
+        tables=table_columns(conn)
+        counts=Counter()
+        served={}
+        for query in queries:
+            try:
+                plan=explain(conn, query)
+            except sqlite3.Error:
+                continue
+            if not uses_full_scan(plan):
+                continue
+            predicates=extract_predicates(query, tables)
+            if predicates is None:
+                continue
+            table, equality, ranges, order=predicates
+            columns=candidate_index(equality, ranges, order)
+            if not columns or is_covered(columns, existing_indexes(conn, table)):
+                continue
+            counts[(table, columns)]+=1
+            served.setdefault((table, columns), []).append(query)
+    finally:
+        conn.close()
+
+    # an index on (a, b, c) also serves queries that only need (a, b)
+    for table, columns in sorted(counts, key=lambda key: len(key[1])):
+        longer=[key for key in counts if key[0]==table and len(key[1])>len(columns) and key[1][:len(columns)]==columns]
+        if longer:
+            target=max(longer, key=lambda key: counts[key])
+            counts[target]+=counts.pop((table, columns))
+            served[target]+=served.pop((table, columns))
+
+    recommendations=[]
+    for (table, columns), count in counts.most_common():
+        if count<min_count:
+            continue
+        recommendations.append({
+            "table": table,
+            "columns": list(columns),
+            "queries": count,
+            "sql": f'CREATE INDEX IF NOT EXISTS {index_name(table, columns)} ON "{table}" ({", ".join(columns)})',
+            "examples": served[(table, columns)][:3]
+        })
+    return recommendations
+
+def apply(recommendations: list, db_path: str=default_db_path, repeats: int=5)->list:
+    '''
+    Creates the recommended indexes and measures their example queries before and after.
+    Example queries only run on a read-only connection; the write connection runs
+    nothing but the advisor's own CREATE INDEX and ANALYZE statements.
+    '''
+    for recommendation in recommendations:
+        recommendation["examples"]=[query for query in recommendation["examples"] if is_read_only(query)]
+    recommendations=[recommendation for recommendation in recommendations if recommendation["examples"]]
+
+    for recommendation in recommendations:
+        reader=read_only_connection(db_path)
+        try:
+            before=[time_query(reader, query, repeats) for query in recommendation["examples"]]
+        finally:
+            reader.close()
+
+        writer=sqlite3.connect(db_path)
+        try:
+            writer.execute(recommendation["sql"])
+            writer.commit()
+        finally:
+            writer.close()
+
+        # a fresh connection, so the plan is prepared against the new schema
+        reader=read_only_connection(db_path)
+        try:
+            after=[time_query(reader, query, repeats) for query in recommendation["examples"]]
+            recommendation["plan_after"]=explain(reader, recommendation["examples"][0])
+        finally:
+            reader.close()
+        recommendation["before_ms"]=round(statistics.mean(before)*1000, 3)
+        recommendation["after_ms"]=round(statistics.mean(after)*1000, 3)
+
+    writer=sqlite3.connect(db_path)
+    try:
+        writer.execute("ANALYZE")
+        writer.commit()
+    finally:
+        writer.close()
+    return recommendations
+
+def main():
+    parser=argparse.ArgumentParser(description="Recommends and optionally creates indexes for the SQL generated by write_sql_query.")
+    parser.add_argument("--db", default=default_db_path)
+    parser.add_argument("--log", default=query_log_path)
+    parser.add_argument("--min-count", type=int, default=1, help="Only recommend indexes that serve at least this many logged queries")
+    parser.add_argument("--apply", action="store_true", help="Create the recommended indexes and report latency before and after")
+    args=parser.parse_args()
+
+    queries=load_queries(args.log)
+    print(f"Analysing {len(queries)} logged queries against {args.db}")
+    recommendations=advise(args.db, queries, args.min_count)
+    if not recommendations:
+        print("No full table scans that an index would help.")
+        return
+
+    if args.apply:
+        recommendations=apply(recommendations, args.db)
+
+    for recommendation in recommendations:
+        print(f"\n{recommendation['sql']}")
+        print(f"  serves {recommendation['queries']} logged queries, e.g. {recommendation['examples'][0]}")
+        if "before_ms" in recommendation:
+            print(f"  latency {recommendation['before_ms']} ms -> {recommendation['after_ms']} ms")
+            print(f"  plan after: {'; '.join(recommendation['plan_after'])}")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,234 @@
+import os
+import time
+import sqlite3
+import argparse
+
+import pandas as pd
+
+from .database import default_db_path
+from .enrichment import POIIndex, EEZClassifier, add_closest_poi, add_eez_status
+
+datasets_dir=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "datasets")
+default_tracks_path=os.path.join(datasets_dir, "data.csv")
+default_poi_path=os.path.join(datasets_dir, "dummy_janes_POI.csv")
+default_eez_path=os.path.join(datasets_dir, "india_eez.json")
+
+tracks_table="OTAS_data"
+poi_table="JANES_data"
+key_columns=("id", "time")
+# the ingest_ prefix keeps these out of the schema catalog, and so out of the SQL prompt
+watermark_table="ingest_watermarks"
+target_watermark_table="ingest_target_watermarks"
+
+def connect(db_path: str=default_db_path)->sqlite3.Connection:
+    '''
+    Writer connection. WAL keeps the read-only pools in backend.database serving
+    the previous snapshot until each batch commits.
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn=sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {watermark_table} (source TEXT PRIMARY KEY, last_time TEXT, rows INTEGER, updated_at REAL)')
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {target_watermark_table} (source TEXT NOT NULL, id TEXT NOT NULL, last_time TEXT NOT NULL, PRIMARY KEY (source, id))')
+    return conn
+
+def lowercase_strings(df: pd.DataFrame)->pd.DataFrame:
+    '''
+    Same normalisation as data_processing.ipynb: every string value lowercased.
+    '''
+    for column in df.columns:
+        if df[column].dtype==object or pd.api.types.is_string_dtype(df[column].dtype):
+            df[column]=df[column].str.lower().where(df[column].map(type)==str, df[column])
+    return df
+
+def sqlite_type(dtype)->str:
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+def table_columns(conn, table: str)->list:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+def ensure_table(conn, table: str, df: pd.DataFrame):
+    '''
+    Creates table from the dataframe's columns, or adds the columns an existing table lacks.
+    '''
+    existing=table_columns(conn, table)
+    if not existing:
+        columns=", ".join(f'"{column}" {sqlite_type(df[column].dtype)}' for column in df.columns)
+        conn.execute(f'CREATE TABLE "{table}" ({columns})')
+        return
+    for column in df.columns:
+        if column not in existing:
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {sqlite_type(df[column].dtype)}')
+
+def ensure_unique_key(conn, table: str, columns: tuple=key_columns):
+    '''
+    Unique index that lets INSERT OR IGNORE drop reports already stored.
+    Duplicates left by earlier full-replace loads are removed first.
+    '''
+    name=f"uq_{table.lower()}_{'_'.join(columns)}"
+    quoted=", ".join(f'"{column}"' for column in columns)
+    try:
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {name} ON "{table}" ({quoted})')
+    except sqlite3.IntegrityError:
+        conn.execute(f'DELETE FROM "{table}" WHERE rowid NOT IN (SELECT MIN(rowid) FROM "{table}" GROUP BY {quoted})')
+        conn.execute(f'CREATE UNIQUE INDEX {name} ON "{table}" ({quoted})')
+    conn.commit()
+
+def get_watermark(conn, source: str):
+    row=conn.execute(f"SELECT last_time FROM {watermark_table} WHERE source=?", (source,)).fetchone()
+    return pd.Timestamp(row[0]) if row and row[0] else None
+
+def set_watermark(conn, source: str, last_time, rows: int):
+    conn.execute(
+        f"INSERT INTO {watermark_table} (source, last_time, rows, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(source) DO UPDATE SET last_time=MAX(COALESCE(last_time, ''), COALESCE(excluded.last_time, '')), rows=rows+excluded.rows, updated_at=excluded.updated_at",
+        (source, last_time.isoformat() if last_time is not None else None, rows, time.time())
+    )
+
+def get_target_watermarks(conn, source: str)->dict:
+    '''
+    Output: {target id: latest report time ingested for it from source}
+    '''
+    return {target: pd.Timestamp(last_time) for target, last_time in conn.execute(f"SELECT id, last_time FROM {target_watermark_table} WHERE source=?", (source,))}
+
+def set_target_watermarks(conn, source: str, ids: pd.Series, times: pd.Series):
+    latest=times[times.notna()].groupby(ids[times.notna()]).max()
+    conn.executemany(
+        f"INSERT INTO {target_watermark_table} (source, id, last_time) VALUES (?, ?, ?) "
+        "ON CONFLICT(source, id) DO UPDATE SET last_time=MAX(last_time, excluded.last_time)",
+        ((source, target, last_time.isoformat()) for target, last_time in latest.items())
+    )
+
+def insert_rows(conn, table: str, df: pd.DataFrame)->int:
+    '''
+    Output: number of rows actually inserted, duplicates on the unique key are skipped
+    '''
+    columns=", ".join(f'"{column}"' for column in df.columns)
+    placeholders=", ".join("?" for _ in df.columns)
+    # object columns hold plain Python values and None for missing ones, which sqlite3 binds directly
+    values=df.astype(object).where(df.notna(), None)
+    before=conn.total_changes
+    conn.executemany(
+        f'INSERT OR IGNORE INTO "{table}" ({columns}) VALUES ({placeholders})',
+        values.itertuples(index=False, name=None)
+    )
+    return conn.total_changes-before
+
+def enrich(df: pd.DataFrame, poi_index: POIIndex=None, eez_classifier: EEZClassifier=None)->pd.DataFrame:
+    if poi_index is not None:
+        df=add_closest_poi(df, poi_index)
+    if eez_classifier is not None:
+        df=add_eez_status(df, eez_classifier)
+    return lowercase_strings(df)
+
+def ingest_chunks(chunks, db_path: str=default_db_path, source: str="tracks", poi_index: POIIndex=None, eez_classifier: EEZClassifier=None, full: bool=False)->dict:
+    '''
+    Input: iterable of raw track report dataframes, enrichment indexes
+    Output: counts of rows read, skipped by the watermark, inserted and duplicate, and throughput.
+    Each chunk is filtered, enriched and committed with its watermark in one transaction before
+    the next is read, so memory is bounded by the chunk size rather than the file size.
+    Each target keeps its own watermark per source: its reports strictly before the latest one already
+    ingested for it are dropped before enrichment, unless full is set, so a refresh only pays for new
+    rows while a late report for one target is not hidden by newer reports from others.
+    Reports at the watermark itself are offered to the (id, time) key, which drops the ones already stored.
+    '''
+    conn=connect(db_path)
+    try:
+        stats={"read": 0, "below_watermark": 0, "inserted": 0, "duplicates": 0}
+        watermarks={} if full else get_target_watermarks(conn, source)
+        started=time.perf_counter()
+        prepared=False
+
+        for chunk in chunks:
+            stats["read"]+=len(chunk)
+            times=pd.to_datetime(chunk["time"], errors="coerce") if "time" in chunk else pd.Series(pd.NaT, index=chunk.index)
+            ids=chunk["id"].astype(str) if "id" in chunk else pd.Series("", index=chunk.index)
+            if watermarks:
+                # unparseable times and unseen targets cannot be compared, so they are left to the unique key
+                target_watermarks=pd.to_datetime(ids.map(watermarks))
+                keep=times.isna() | target_watermarks.isna() | (times>=target_watermarks)
+                stats["below_watermark"]+=int((~keep).sum())
+                chunk, times, ids=chunk[keep], times[keep], ids[keep]
+            if chunk.empty:
+                continue
+
+            chunk=enrich(chunk.copy(), poi_index, eez_classifier)
+            if not prepared:
+                ensure_table(conn, tracks_table, chunk)
+                ensure_unique_key(conn, tracks_table)
+                prepared=True
+            with conn:
+                inserted=insert_rows(conn, tracks_table, chunk)
+                latest=times.max()
+                set_watermark(conn, source, None if pd.isna(latest) else latest, inserted)
+                set_target_watermarks(conn, source, ids, times)
+            stats["inserted"]+=inserted
+            stats["duplicates"]+=len(chunk)-inserted
+
+            elapsed=time.perf_counter()-started
+            print(f"{source}: {stats['read']} rows read, {stats['inserted']} inserted, {stats['read']/elapsed:,.0f} rows/s")
+
+        stats["seconds"]=round(time.perf_counter()-started, 3)
+        stats["rows_per_second"]=round(stats["read"]/stats["seconds"]) if stats["seconds"] else 0
+        return stats
+    finally:
+        conn.close()
+
+def ingest_tracks(df: pd.DataFrame, db_path: str=default_db_path, source: str="tracks", poi_index: POIIndex=None, eez_classifier: EEZClassifier=None, batch_size: int=5000, full: bool=False)->dict:
+    '''
+    Input: track reports already in memory, committed batch_size rows per transaction
+    '''
+    batches=(df.iloc[start:start+batch_size] for start in range(0, len(df), batch_size))
+    return ingest_chunks(batches, db_path, source, poi_index, eez_classifier, full)
+
+def ingest_csv(path: str, db_path: str=default_db_path, source: str=None, poi_index: POIIndex=None, eez_classifier: EEZClassifier=None, chunksize: int=50000, full: bool=False)->dict:
+    '''
+    Input: track CSV, read and committed chunksize rows at a time
+    '''
+    with pd.read_csv(path, chunksize=chunksize) as reader:
+        return ingest_chunks(reader, db_path, source or os.path.basename(path), poi_index, eez_classifier, full)
+
+def load_points_of_interest(df: pd.DataFrame, db_path: str=default_db_path)->int:
+    '''
+    Replaces the JANES points inside one transaction, so readers never see the table empty.
+    '''
+    df=lowercase_strings(df.drop(columns=["location_target"], errors="ignore").copy())
+    conn=connect(db_path)
+    try:
+        ensure_table(conn, poi_table, df)
+        with conn:
+            conn.execute(f'DELETE FROM "{poi_table}"')
+            inserted=insert_rows(conn, poi_table, df)
+        return inserted
+    finally:
+        conn.close()
+
+def main():
+    parser=argparse.ArgumentParser(description="Appends new track reports to the database, enriched with closest POI and EEZ status.")
+    parser.add_argument("tracks", nargs="?", default=default_tracks_path)
+    parser.add_argument("--db", default=default_db_path)
+    parser.add_argument("--poi", default=default_poi_path, help="JANES points of interest CSV")
+    parser.add_argument("--eez", default=default_eez_path, help="EEZ boundary GeoJSON")
+    parser.add_argument("--source", help="Watermark name, defaults to the tracks file name")
+    parser.add_argument("--chunksize", type=int, default=50000, help="Rows read, enriched and committed at a time; bounds peak memory")
+    parser.add_argument("--full", action="store_true", help="Ignore the watermark and offer every row to the (id, time) key")
+    args=parser.parse_args()
+
+    df_poi=pd.read_csv(args.poi)
+    poi_index=POIIndex.from_dataframe(df_poi)
+    eez_classifier=EEZClassifier.from_file(args.eez) if os.path.exists(args.eez) else None
+    if eez_classifier is None:
+        print(f"No EEZ boundaries at {args.eez}, skipping location_wrt_naval_borders")
+
+    print(f"Loaded {load_points_of_interest(df_poi, args.db)} points of interest into {poi_table}")
+    stats=ingest_csv(args.tracks, args.db, args.source, poi_index, eez_classifier, args.chunksize, args.full)
+    print(f"Read {stats['read']} reports: {stats['below_watermark']} older than their target's watermark, {stats['inserted']} inserted, {stats['duplicates']} duplicates")
+    print(f"{stats['seconds']} s, {stats['rows_per_second']:,} rows/s")
+
+if __name__=="__main__":
+    main()
@@ -1,20 +1,21 @@
 from langgraph.graph import StateGraph, END, START
 import os
+from .metrics import metrics, InstrumentedGraph
 from .functions import State, load_model, assign_db, router, write_sql_query, execute_query, report_generation, elaborate_on_response, update_chat_history, general_response
 
 workflow=StateGraph(State)
 
-workflow.add_node("assign_db_node", assign_db)
-workflow.add_node("router_node", router)
-workflow.add_node("write_sql_node", write_sql_query)
-workflow.add_node("execute_sql_node", execute_query)
-workflow.add_node("report_gen_node", report_generation)
-workflow.add_node("elaborate_node", elaborate_on_response)
-workflow.add_node("update_chat_node", update_chat_history)
-workflow.add_node("general_query_node", general_response)
+workflow.add_node("assign_db_node", metrics.instrument("assign_db_node", assign_db))
+workflow.add_node("router_node", metrics.instrument("router_node", router))
+workflow.add_node("write_sql_node", metrics.instrument("write_sql_node", write_sql_query))
+workflow.add_node("execute_sql_node", metrics.instrument("execute_sql_node", execute_query))
+workflow.add_node("report_gen_node", metrics.instrument("report_gen_node", report_generation))
+workflow.add_node("elaborate_node", metrics.instrument("elaborate_node", elaborate_on_response))
+workflow.add_node("update_chat_node", metrics.instrument("update_chat_node", update_chat_history))
+workflow.add_node("general_query_node", metrics.instrument("general_query_node", general_response))
 
-workflow.add_node("write_sql_for_general", write_sql_query)
-workflow.add_node("execute_sql_for_general", execute_query)
+workflow.add_node("write_sql_for_general", metrics.instrument("write_sql_for_general", write_sql_query))
+workflow.add_node("execute_sql_for_general", metrics.instrument("execute_sql_for_general", execute_query))
 
 state: State={}
 
@@ -41,7 +42,8 @@ workflow.add_edge("general_query_node", "update_chat_node")
 
 workflow.add_edge("update_chat_node", END)
 
-app=workflow.compile()
+# every node reports wall, model and SQL time to backend.metrics
+app=InstrumentedGraph(workflow.compile())
 
 
 
@@ -0,0 +1,212 @@
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+
+metrics_log_file="node_metrics.jsonl"
+
+current_invocation=contextvars.ContextVar("current_invocation", default=None)
+current_node=contextvars.ContextVar("current_node", default=None)
+
+def perf_counters(llm):
+    '''
+    Output: llama.cpp's cumulative (prompt eval ms, decode ms, prompt eval tokens, decoded tokens),
+    or None when the model does not expose them, e.g. the MCP RemoteLlama client
+    '''
+    try:
+        import llama_cpp
+        ctx=llm._ctx.ctx
+        if hasattr(llama_cpp, "llama_perf_context"):
+            data=llama_cpp.llama_perf_context(ctx)
+        else:
+            data=llama_cpp.llama_get_timings(ctx)
+        return (data.t_p_eval_ms, data.t_eval_ms, data.n_p_eval, data.n_eval)
+    except Exception:
+        return None
+
+def _count_tokens(llm, text: str)->int:
+    try:
+        return len(llm.tokenize(text.encode("utf-8"), special=True))
+    except Exception:
+        return 0
+
+class NodeMetrics:
+    '''
+    Per node timings for each graph invocation: wall time, prompt eval and decode time,
+    prompt and completion tokens, and SQL execution time.
+    Nodes are wrapped with instrument(); model calls and SQL report into the node that is
+    running through a context variable, so the node functions themselves are unchanged.
+    Every finished node is appended to metrics_log_file and kept in memory for summary().
+    '''
+    def __init__(self, log_file: str=metrics_log_file, history: int=500):
+        self.log_file=log_file
+        self.records=deque(maxlen=history)
+        self.lock=threading.Lock()
+
+    def instrument(self, name: str, fn):
+        def node(state):
+            record={
+                "invocation": current_invocation.get() or uuid.uuid4().hex,
+                "node": name,
+                "timestamp": time.time(),
+                "wall_seconds": 0.0,
+                "llm_calls": 0,
+                "llm_seconds": 0.0,
+                "prompt_eval_seconds": 0.0,
+                "decode_seconds": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "sql_queries": 0,
+                "sql_seconds": 0.0
+            }
+            token=current_node.set(record)
+            started=time.perf_counter()
+            try:
+                return fn(state)
+            finally:
+                record["wall_seconds"]=time.perf_counter()-started
+                current_node.reset(token)
+                self._finish(record)
+        node.__name__=getattr(fn, "__name__", name)
+        return node
+
+    def _finish(self, record: dict):
+        for key, value in record.items():
+            if isinstance(value, float) and key!="timestamp":
+                record[key]=round(value, 4)
+        with self.lock:
+            self.records.append(record)
+        try:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record)+"\n")
+        except OSError as e:
+            print(f"Could not write node metrics: {e}")
+
+    def record_completion(self, llm, response: dict, started: float, before):
+        '''
+        Adds one finished (non streamed) completion to the running node.
+        '''
+        record=current_node.get()
+        if record is None:
+            return
+        usage=response.get("usage") or {}
+        self._add_llm(record, llm, time.perf_counter()-started, before, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), None)
+
+    def track_stream(self, llm, chunks, prompt: str, started: float, before):
+        '''
+        Passes streamed chunks through, adding the completion to the running node once it ends.
+        Without llama.cpp counters, time to the first chunk is taken as prompt eval.
+        '''
+        record=current_node.get()
+        if record is None:
+            yield from chunks
+            return
+        first_chunk=None
+        completion_tokens=0
+        try:
+            for chunk in chunks:
+                if first_chunk is None:
+                    first_chunk=time.perf_counter()-started
+                completion_tokens+=1
+                yield chunk
+        finally:
+            self._add_llm(record, llm, time.perf_counter()-started, before, _count_tokens(llm, prompt), completion_tokens, first_chunk)
+
+    def _add_llm(self, record: dict, llm, seconds: float, before, prompt_tokens: int, completion_tokens: int, first_chunk: float):
+        after=perf_counters(llm) if before is not None else None
+        if after is not None:
+            prompt_eval=(after[0]-before[0])/1000
+            decode=(after[1]-before[1])/1000
+        elif first_chunk is not None:
+            prompt_eval=first_chunk
+            decode=seconds-first_chunk
+        else:
+            prompt_eval=0.0
+            decode=0.0
+        record["llm_calls"]+=1
+        record["llm_seconds"]+=seconds
+        record["prompt_eval_seconds"]+=prompt_eval
+        record["decode_seconds"]+=decode
+        record["prompt_tokens"]+=prompt_tokens
+        record["completion_tokens"]+=completion_tokens
+
+    def record_sql(self, seconds: float):
+        record=current_node.get()
+        if record is None:
+            return
+        record["sql_queries"]+=1
+        record["sql_seconds"]+=seconds
+
+    def summary(self)->list:
+        '''
+        Output: one row per node with call count and mean seconds and tokens, slowest total first
+        '''
+        with self.lock:
+            records=list(self.records)
+        nodes={}
+        for record in records:
+            nodes.setdefault(record["node"], []).append(record)
+
+        rows=[]
+        for name, entries in nodes.items():
+            count=len(entries)
+            walls=sorted(entry["wall_seconds"] for entry in entries)
+            rows.append({
+                "node": name,
+                "calls": count,
+                "total_s": round(sum(walls), 3),
+                "mean_s": round(sum(walls)/count, 3),
+                "p95_s": walls[min(count-1, int(count*0.95))],
+                "prompt_eval_s": round(sum(entry["prompt_eval_seconds"] for entry in entries)/count, 3),
+                "decode_s": round(sum(entry["decode_seconds"] for entry in entries)/count, 3),
+                "sql_s": round(sum(entry["sql_seconds"] for entry in entries)/count, 3),
+                "prompt_tokens": round(sum(entry["prompt_tokens"] for entry in entries)/count),
+                "completion_tokens": round(sum(entry["completion_tokens"] for entry in entries)/count)
+            })
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def last_invocation(self)->list:
+        '''
+        Output: the node records of the most recent invocation, in execution order
+        '''
+        with self.lock:
+            if not self.records:
+                return []
+            invocation=self.records[-1]["invocation"]
+            return [record for record in self.records if record["invocation"]==invocation]
+
+class InstrumentedGraph:
+    '''
+    Compiled graph whose invoke and stream tag every node record with one invocation id.
+    Anything else is passed to the compiled graph unchanged.
+    '''
+    def __init__(self, graph):
+        self.graph=graph
+
+    def invoke(self, *args, **kwargs):
+        token=current_invocation.set(uuid.uuid4().hex)
+        try:
+            return self.graph.invoke(*args, **kwargs)
+        finally:
+            current_invocation.reset(token)
+
+    def stream(self, *args, **kwargs):
+        # set per step, since the caller's context is the one active while each chunk is produced
+        invocation=uuid.uuid4().hex
+        chunks=self.graph.stream(*args, **kwargs)
+        while True:
+            token=current_invocation.set(invocation)
+            try:
+                chunk=next(chunks)
+            except StopIteration:
+                return
+            finally:
+                current_invocation.reset(token)
+            yield chunk
+
+    def __getattr__(self, name):
+        return getattr(self.graph, name)
+
+metrics=NodeMetrics()
@@ -0,0 +1,138 @@
+import threading
+import time
+import os
+
+class ModelManager:
+    '''
+    Process-wide owner of the llama model.
+    Loads lazily on first use, can warm up and unload after idling,
+    and reports its status, so Streamlit reruns reuse one warm instance.
+    '''
+    def __init__(self):
+        self.lock=threading.RLock()
+        # llama.cpp contexts are not thread safe, every evaluation on self.llm holds this
+        self.inference_lock=threading.Lock()
+        self.llm=None
+        self.path=None
+        self.options={}
+        self.idle_timeout=None
+        self.warm_up_on_load=True
+        self.state="unconfigured"
+        self.error=None
+        self.loaded_at=None
+        self.last_used=None
+        self.load_seconds=None
+        self.load_count=0
+        self.unload_listeners=[]
+        self.idle_thread=None
+
+    def configure(self, path: str, n_ctx: int=8192, use_mmap: bool=True, use_mlock: bool=False, idle_timeout: float=None, warm_up: bool=True):
+        '''
+        Sets what should be loaded. Cheap to call on every rerun;
+        the model is only reloaded if the path or load options change.
+        '''
+        options={"n_ctx": n_ctx, "use_mmap": use_mmap, "use_mlock": use_mlock}
+        with self.lock:
+            if self.llm is not None and (path!=self.path or options!=self.options):
+                self.unload()
+            self.path=path
+            self.options=options
+            self.idle_timeout=idle_timeout
+            self.warm_up_on_load=warm_up
+            if self.state=="unconfigured":
+                self.state="unloaded"
+
+        if idle_timeout and self.idle_thread is None:
+            self.idle_thread=threading.Thread(target=self._watch_idle, daemon=True)
+            self.idle_thread.start()
+
+    def load(self):
+        import llama_cpp
+
+        with self.lock:
+            if self.llm is not None:
+                return self.llm
+            if self.path is None:
+                raise RuntimeError("Model manager is not configured with a model path")
+
+            print("---------------------------------\n\n")
+            print("Loading model")
+            print("---------------------------------\n\n")
+            self.state="loading"
+            start=time.time()
+            try:
+                self.llm=llama_cpp.Llama(model_path=self.path, chat_format="llama-2", **self.options)
+                if self.warm_up_on_load:
+                    self.warm_up()
+            except Exception as e:
+                self.llm=None
+                self.state="error"
+                self.error=str(e)
+                raise
+
+            self.load_seconds=time.time()-start
+            self.loaded_at=time.time()
+            self.last_used=self.loaded_at
+            self.load_count+=1
+            self.state="ready"
+            self.error=None
+            return self.llm
+
+    def warm_up(self):
+        '''
+        Runs a one token completion so the first user request does not pay for page faults and graph setup.
+        '''
+        with self.inference_lock:
+            self.llm.create_completion(prompt="Hello", max_tokens=1, temperature=0.0)
+            self.llm.reset()
+
+    def get(self):
+        '''
+        Output: loaded llm, loading it first if needed
+        '''
+        with self.lock:
+            llm=self.llm if self.llm is not None else self.load()
+            self.last_used=time.time()
+            return llm
+
+    def unload(self):
+        with self.lock:
+            if self.llm is None:
+                return
+            print("Unloading model")
+            self.llm=None
+            self.state="unloaded"
+            for listener in self.unload_listeners:
+                listener()
+
+    def add_unload_listener(self, listener):
+        self.unload_listeners.append(listener)
+
+    def _watch_idle(self):
+        while True:
+            time.sleep(5)
+            with self.lock:
+                if self.llm is None or not self.idle_timeout:
+                    continue
+                if time.time()-self.last_used>self.idle_timeout:
+                    print(f"Model idle for more than {self.idle_timeout} seconds")
+                    self.unload()
+
+    def is_healthy(self)->bool:
+        return self.state in ("ready", "unloaded")
+
+    def status(self)->dict:
+        now=time.time()
+        return {
+            "state": self.state,
+            "model": os.path.basename(self.path) if self.path else None,
+            "use_mmap": self.options.get("use_mmap"),
+            "use_mlock": self.options.get("use_mlock"),
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "loads": self.load_count,
+            "idle_seconds": round(now-self.last_used, 1) if self.llm is not None else None,
+            "idle_timeout": self.idle_timeout,
+            "error": self.error
+        }
+
+model_manager=ModelManager()
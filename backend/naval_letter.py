@@ -0,0 +1,255 @@
+import re
+from datetime import datetime
+from fpdf import FPDF
+
+letter_from="Commanding Officer, Maritime Surveillance Cell"
+letter_to="Fleet Operations Officer, Western Naval Command"
+letter_signature="COMMANDING OFFICER"
+subject_max_chars=120
+
+# paragraph labels and indents (inches) of navy correspondence, by depth
+label_styles=("number", "letter", "paren_number", "paren_letter", "number")
+label_indents=(0.0, 0.25, 0.5, 0.75, 1.0)
+
+margin=1.0
+tab=0.75
+line_height=0.2
+font="Times"
+font_size=12
+
+# core pdf fonts are latin-1 only
+replacements={
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "•": "-", "…": "...",
+    "→": "->", "←": "<-", "≤": "<=", "≥": ">=", " ": " "
+}
+
+heading_pattern=re.compile(r"^\s*(#{1,6})\s+(.*?)\s*#*\s*$")
+bold_heading_pattern=re.compile(r"^\s*(?:\*\*|__)(.+?)(?:\*\*|__)\s*:?\s*$")
+item_pattern=re.compile(r"^(\s*)(?:[-*+]|\d+[.)]|[a-zA-Z][.)])\s+(.*)$")
+table_pattern=re.compile(r"^\s*\|.*\|\s*$")
+table_separator_pattern=re.compile(r"^\s*\|?\s*:?-{3,}")
+rule_pattern=re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+
+def clean_inline(text: str)->str:
+    '''
+    Strips inline markdown: emphasis, code spans and links.
+    '''
+    text=re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text=re.sub(r"(\*\*|__|\*|`)", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def pdf_text(text: str)->str:
+    for char, replacement in replacements.items():
+        text=text.replace(char, replacement)
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+def paragraph_label(depth: int, count: int)->str:
+    style=label_styles[min(depth, len(label_styles)-1)]
+    if style=="number":
+        return f"{count}."
+    if style=="letter":
+        return f"{chr(ord('a')+(count-1)%26)}."
+    if style=="paren_number":
+        return f"({count})"
+    return f"({chr(ord('a')+(count-1)%26)})"
+
+def subject_line(text: str)->str:
+    '''
+    Navy subject rule: all caps, no punctuation, at most two lines.
+    '''
+    subject=re.sub(r"[^A-Za-z0-9 ]+", " ", clean_inline(text)).upper()
+    subject=re.sub(r"\s+", " ", subject).strip()
+    if len(subject)>subject_max_chars:
+        subject=subject[:subject_max_chars].rsplit(" ", 1)[0]
+    return subject
+
+def _table_rows(lines: list)->list:
+    '''
+    Output: one "column: value" line per data row of a markdown table
+    '''
+    rows=[[clean_inline(cell) for cell in line.strip().strip("|").split("|")] for line in lines if not table_separator_pattern.match(line)]
+    if len(rows)<2:
+        return ["; ".join(cell for cell in row if cell) for row in rows]
+    header=rows[0]
+    return ["; ".join(f"{column}: {value}" for column, value in zip(header, row) if value) for row in rows[1:]]
+
+def format_naval_letter(report: str, question: str=None, date: datetime=None, sender: str=letter_from, recipient: str=letter_to, signature: str=letter_signature)->dict:
+    '''
+    Maps a markdown report onto the naval correspondence layout, without a model pass.
+    Input: report in markdown, the operator's question for the subject and reference lines
+    Output: letter dict with header fields and paragraphs, each {"depth", "label", "heading", "text"}
+    - the first top-level heading becomes the subject, later headings numbered paragraphs
+    - list items nest under the current paragraph as a., (1), (a), 1.
+    - table rows become list items, one per row
+    '''
+    lines=report.replace("```", "").splitlines()
+    subject=None
+    paragraphs=[]
+    counters=[0]*len(label_styles)
+    indents=[]
+    in_section=False
+    text_lines=[]
+    table_lines=[]
+
+    def add(depth: int, text: str="", heading: str=None):
+        depth=min(depth, len(label_styles)-1)
+        counters[depth]+=1
+        for deeper in range(depth+1, len(counters)):
+            counters[deeper]=0
+        paragraphs.append({"depth": depth, "label": paragraph_label(depth, counters[depth]), "heading": heading, "text": text})
+
+    def flush_text():
+        if not text_lines:
+            return
+        text=clean_inline(" ".join(text_lines))
+        text_lines.clear()
+        last=paragraphs[-1] if paragraphs else None
+        if in_section and last is not None and last["heading"] and not last["text"]:
+            last["text"]=text
+        elif in_section and last is not None:
+            # later paragraphs of a section continue it, unlabeled
+            paragraphs.append({"depth": last["depth"], "label": "", "heading": None, "text": text})
+        else:
+            add(0, text)
+
+    def flush_table():
+        if not table_lines:
+            return
+        for row in _table_rows(table_lines):
+            add(1 if paragraphs else 0, row)
+        table_lines.clear()
+
+    for line in lines+[""]:
+        if table_pattern.match(line):
+            flush_text()
+            table_lines.append(line)
+            continue
+        flush_table()
+
+        heading=heading_pattern.match(line) or bold_heading_pattern.match(line)
+        item=item_pattern.match(line)
+        if not line.strip() or rule_pattern.match(line):
+            flush_text()
+            indents.clear()
+        elif heading:
+            flush_text()
+            indents.clear()
+            title=clean_inline(heading.groups()[-1]).rstrip(":")
+            if subject is None and not paragraphs and (heading.re is bold_heading_pattern or len(heading.group(1))==1):
+                subject=subject_line(title)
+            else:
+                add(0, heading=title)
+                in_section=True
+        elif item:
+            flush_text()
+            indent=len(item.group(1).expandtabs(4))
+            while indents and indents[-1]>indent:
+                indents.pop()
+            if not indents or indents[-1]<indent:
+                indents.append(indent)
+            # items nest under the open numbered paragraph, or start one when there is none
+            base=1 if paragraphs else 0
+            add(base+len(indents)-1, clean_inline(item.group(2)))
+        else:
+            text_lines.append(line.strip())
+
+    if subject is None:
+        subject=subject_line(question or "Maritime situation report")
+
+    return {
+        "date": (date or datetime.now()).strftime("%d %b %y"),
+        "from": sender,
+        "to": recipient,
+        "subject": subject,
+        "references": [f"Operator query: {clean_inline(question)}"] if question else [],
+        "paragraphs": paragraphs,
+        "signature": signature
+    }
+
+class LetterPDF(FPDF):
+    '''
+    One inch margins, subject repeated at the top and page number centred
+    half an inch from the bottom of every page after the first.
+    '''
+    def __init__(self, subject: str=""):
+        super().__init__(orientation="P", unit="in", format="A4")
+        self.subject=subject
+        self.set_margins(margin, margin, margin)
+        self.set_auto_page_break(True, margin)
+        self.set_font(font, size=font_size)
+
+    def header(self):
+        if self.page_no()>1 and self.subject:
+            self.set_font(font, size=font_size)
+            self.cell(tab, line_height, "Subj:")
+            self.multi_cell(0, line_height, pdf_text(self.subject), new_x="LMARGIN", new_y="NEXT")
+            self.ln(line_height)
+
+    def footer(self):
+        if self.page_no()>1:
+            self.set_y(-0.5)
+            self.set_font(font, size=font_size)
+            self.cell(0, line_height, str(self.page_no()), align="C")
+
+def _field(pdf: LetterPDF, label: str, value: str):
+    pdf.cell(tab, line_height, label)
+    pdf.multi_cell(0, line_height, pdf_text(value), new_x="LMARGIN", new_y="NEXT")
+
+def render_letter_pdf(letter: dict)->bytes:
+    '''
+    Input: letter dict from format_naval_letter
+    Output: PDF bytes, rendered in process
+    '''
+    pdf=LetterPDF(letter["subject"])
+    pdf.add_page()
+
+    pdf.set_x(margin+4.5)
+    pdf.cell(0, line_height, letter["date"], new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(line_height)
+    _field(pdf, "From:", letter["from"])
+    _field(pdf, "To:", letter["to"])
+    pdf.ln(line_height)
+    _field(pdf, "Subj:", letter["subject"])
+    pdf.ln(line_height)
+    if letter["references"]:
+        for i, reference in enumerate(letter["references"]):
+            _field(pdf, "Ref:" if i==0 else "", f"({chr(ord('a')+i)}) {reference}")
+        pdf.ln(line_height)
+
+    for paragraph in letter["paragraphs"]:
+        # continuation lines wrap back to the left margin, as navy paragraphs do
+        pdf.set_x(margin+label_indents[paragraph["depth"]])
+        if paragraph["label"]:
+            pdf.write(line_height, f"{paragraph['label']}  ")
+        if paragraph["heading"]:
+            pdf.set_font(font, style="U", size=font_size)
+            pdf.write(line_height, pdf_text(paragraph["heading"].rstrip(".")+"."))
+            pdf.set_font(font, size=font_size)
+            pdf.write(line_height, "  ")
+        pdf.write(line_height, pdf_text(paragraph["text"]))
+        pdf.ln(line_height)
+        pdf.ln(line_height)
+
+    pdf.ln(line_height*2)
+    pdf.set_x(margin+3.25)
+    pdf.cell(0, line_height, pdf_text(letter["signature"]), new_x="LMARGIN", new_y="NEXT")
+    return bytes(pdf.output())
+
+def render_text_pdf(text: str)->bytes:
+    '''
+    Input: letter already laid out as plain text, e.g. by the model reformatting pass
+    Output: PDF bytes, keeping each line's leading indentation
+    '''
+    pdf=LetterPDF()
+    pdf.add_page()
+    for line in text.splitlines():
+        expanded=line.expandtabs(4)
+        stripped=expanded.lstrip()
+        if not stripped:
+            pdf.ln(line_height)
+            continue
+        indent=min((len(expanded)-len(stripped))//4*0.25, 2.0)
+        pdf.set_x(margin+indent)
+        pdf.multi_cell(0, line_height, pdf_text(clean_inline(stripped)), new_x="LMARGIN", new_y="NEXT")
+    return bytes(pdf.output())
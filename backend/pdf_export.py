@@ -0,0 +1,165 @@
+import os
+import hashlib
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from .functions import pdf_result
+
+default_cache_dir=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pdf_cache")
+
+# bump when the letter layout changes, so older renders are not served
+layout_version="1"
+
+class PDFExporter:
+    '''
+    Renders report PDFs on a background worker as soon as a report is produced.
+    Finished PDFs are stored on disk under the hash of the report content and render options,
+    so downloading the same report again, in any session or after a restart, reads the file.
+    The cache is bounded by file count and total size, evicting the least recently used PDFs.
+    '''
+    def __init__(self, cache_dir: str=default_cache_dir, max_files: int=64, max_bytes: int=64*1024*1024, workers: int=1):
+        self.cache_dir=cache_dir
+        self.max_files=max_files
+        self.max_bytes=max_bytes
+        self.executor=ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-export")
+        self.lock=threading.Lock()
+        self.jobs={}
+        self.errors={}
+        self.hits=0
+        self.renders=0
+        self.failures=0
+        self.evictions=0
+
+    def key(self, state: dict, llm_format: bool=False)->str:
+        question=state.get("report_question") or state.get("question") or ""
+        content="\0".join([layout_version, "llm" if llm_format else "template", question, state["report"]])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def path(self, key: str)->str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def _render(self, key: str, state: dict, llm_format: bool):
+        try:
+            pdf_bytes=pdf_result(state, file_path=None, llm_format=llm_format)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path=f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(pdf_bytes)
+            os.replace(temp_path, self.path(key))
+            with self.lock:
+                self.renders+=1
+            self._evict()
+        except Exception as e:
+            traceback.print_exc()
+            with self.lock:
+                self.failures+=1
+                self.errors[key]=str(e)
+        finally:
+            with self.lock:
+                self.jobs.pop(key, None)
+
+    def submit(self, state: dict, llm_format: bool=False, retry: bool=False)->str:
+        '''
+        Starts rendering the report in state unless it is already cached or being rendered.
+        A failed job stays failed until it is submitted again with retry=True.
+        Output: job key, for status, wait and read
+        '''
+        key=self.key(state, llm_format)
+        with self.lock:
+            if key in self.jobs or os.path.exists(self.path(key)):
+                return key
+            if key in self.errors and not retry:
+                return key
+            self.errors.pop(key, None)
+            # the worker renders a snapshot, later edits to the session state do not leak into it
+            snapshot={field: state.get(field) for field in ("report", "question", "report_question")}
+            self.jobs[key]=self.executor.submit(self._render, key, snapshot, llm_format)
+        return key
+
+    def status(self, key: str)->str:
+        '''
+        Output: "ready", "running", "failed" or "missing"
+        '''
+        with self.lock:
+            if key in self.jobs:
+                return "running"
+            if key in self.errors:
+                return "failed"
+        return "ready" if os.path.exists(self.path(key)) else "missing"
+
+    def error(self, key: str)->str:
+        with self.lock:
+            return self.errors.get(key)
+
+    def wait(self, key: str, timeout: float=None)->str:
+        '''
+        Blocks up to timeout seconds for a running job.
+        Output: status after waiting
+        '''
+        with self.lock:
+            job=self.jobs.get(key)
+        if job is not None:
+            try:
+                job.result(timeout)
+            except Exception:
+                pass
+        return self.status(key)
+
+    def read(self, key: str)->bytes:
+        '''
+        Output: PDF bytes of a finished job, or None
+        '''
+        try:
+            with open(self.path(key), "rb") as f:
+                pdf_bytes=f.read()
+        except FileNotFoundError:
+            return None
+        # mtime orders eviction, so a read counts as a use
+        os.utime(self.path(key))
+        with self.lock:
+            self.hits+=1
+        return pdf_bytes
+
+    def _entries(self)->list:
+        entries=[]
+        try:
+            names=os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                stat=os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def _evict(self):
+        entries=self._entries()
+        total_bytes=sum(size for _, size, _ in entries)
+        while entries and (len(entries)>self.max_files or total_bytes>self.max_bytes):
+            _, size, name=entries.pop(0)
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            total_bytes-=size
+            with self.lock:
+                self.evictions+=1
+
+    def stats(self)->dict:
+        entries=self._entries()
+        with self.lock:
+            return {
+                "files": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "running": len(self.jobs),
+                "hits": self.hits,
+                "renders": self.renders,
+                "failures": self.failures,
+                "evictions": self.evictions
+            }
+
+pdf_exporter=PDFExporter()
@@ -0,0 +1,75 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from .metrics import metrics, perf_counters
+
+class PrefixCache:
+    '''
+    Keeps llama KV-state snapshots of static prompt prefixes.
+    A prefix is evaluated once, and its state is restored before each completion,
+    so llama.cpp only evaluates the tokens after the longest matching prefix.
+    Every completion holds lock, from restoring the prefix to the last streamed chunk,
+    so graph nodes and background jobs never share the context at the same time.
+    '''
+    def __init__(self, max_entries: int=6, lock=None):
+        self.max_entries=max_entries
+        self.lock=lock or threading.Lock()
+        self.states=OrderedDict()
+        self.llm_id=None
+        self.hits=0
+        self.misses=0
+
+    def _key(self, prefix: str)->str:
+        return hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+
+    def _state_for(self, llm, prefix: str):
+        if self.llm_id!=id(llm):
+            # snapshots are only valid for the model instance that produced them
+            self.states.clear()
+            self.llm_id=id(llm)
+
+        key=self._key(prefix)
+        if key in self.states:
+            self.hits+=1
+            self.states.move_to_end(key)
+            return self.states[key]
+
+        self.misses+=1
+        print("Evaluating prompt prefix for cache")
+        tokens=llm.tokenize(prefix.encode("utf-8"), special=True)
+        llm.reset()
+        llm.eval(tokens)
+        state=llm.save_state()
+
+        self.states[key]=state
+        if len(self.states)>self.max_entries:
+            self.states.popitem(last=False)
+        return state
+
+    def complete(self, llm, prefix: str, suffix: str, **kwargs)->dict:
+        '''
+        Input: model, static prompt prefix, variable prompt suffix, completion arguments
+        Output: llama completion response for prefix+suffix
+        '''
+        if kwargs.get("stream"):
+            return self._stream(llm, prefix, suffix, kwargs)
+        with self.lock:
+            started=time.perf_counter()
+            before=perf_counters(llm)
+            llm.load_state(self._state_for(llm, prefix))
+            response=llm.create_completion(prompt=prefix+suffix, **kwargs)
+            metrics.record_completion(llm, response, started, before)
+        return response
+
+    def _stream(self, llm, prefix: str, suffix: str, kwargs: dict):
+        with self.lock:
+            started=time.perf_counter()
+            before=perf_counters(llm)
+            llm.load_state(self._state_for(llm, prefix))
+            chunks=llm.create_completion(prompt=prefix+suffix, **kwargs)
+            yield from metrics.track_stream(llm, chunks, prefix+suffix, started, before)
+
+    def clear(self):
+        self.states.clear()
+        self.llm_id=None
@@ -0,0 +1,75 @@
+def _column_type(values: list)->str:
+    kinds={type(value) for value in values if value is not None}
+    if not kinds:
+        return "null"
+    if kinds<={int}:
+        return "int"
+    if kinds<={int, float}:
+        return "float"
+    if kinds<={bytes}:
+        return "blob"
+    return "text"
+
+def to_columnar(columns: list, rows: list, max_rows: int=None)->dict:
+    '''
+    Input: column names, row tuples, row limit the rows were fetched with
+    Output: {"columns", "types", "data", "row_count", "truncated"}, with data holding one list per column
+    '''
+    truncated=max_rows is not None and len(rows)>max_rows
+    if truncated:
+        rows=rows[:max_rows]
+    data={column: [row[i] for row in rows] for i, column in enumerate(columns)}
+    return {
+        "columns": list(columns),
+        "types": {column: _column_type(values) for column, values in data.items()},
+        "data": data,
+        "row_count": len(rows),
+        "truncated": truncated
+    }
+
+def error_result(message: str)->dict:
+    return {"columns": [], "types": {}, "data": {}, "row_count": 0, "truncated": False, "error": message}
+
+def is_error(result)->bool:
+    return isinstance(result, dict) and "error" in result
+
+def rows(result: dict)->list:
+    '''
+    Output: row tuples, for callers that need them
+    '''
+    return list(zip(*(result["data"][column] for column in result["columns"])))
+
+def _cell(value)->str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value).replace("|", "/").replace("\n", " ")
+
+def format_for_prompt(result, max_rows: int=None)->str:
+    '''
+    Dense pipe separated table for LLM prompts: the column labels once, then one line per row.
+    '''
+    if not isinstance(result, dict):
+        return str(result or "")
+    if is_error(result):
+        return f"Query failed: {result['error']}"
+    if result["row_count"]==0:
+        return "No rows matched the query."
+
+    columns=result["columns"]
+    shown=result["row_count"] if max_rows is None else min(max_rows, result["row_count"])
+    lines=["|".join(columns)]
+    for i in range(shown):
+        lines.append("|".join(_cell(result["data"][column][i]) for column in columns))
+    if shown<result["row_count"] or result["truncated"]:
+        lines.append(f"({shown} of {result['row_count']}{'+' if result['truncated'] else ''} rows shown)")
+    return "\n".join(lines)
+
+def format_for_ui(result)->dict:
+    '''
+    Column name to values mapping, accepted directly by st.dataframe.
+    '''
+    if not isinstance(result, dict) or is_error(result):
+        return {}
+    return result["data"]
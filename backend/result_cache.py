@@ -0,0 +1,114 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+def normalise_sql(query: str)->str:
+    '''
+    Collapses whitespace, case and trailing semicolons outside string literals.
+    '''
+    parts=re.split(r"('(?:[^']|'')*')", query.strip().rstrip(";").strip())
+    normalised=[]
+    for i, part in enumerate(parts):
+        if i%2==1:
+            normalised.append(part)
+        else:
+            normalised.append(re.sub(r"\s+", " ", part).lower())
+    return "".join(normalised).strip()
+
+def database_path(db)->str:
+    '''
+    Input: backend.database.Database
+    Output: path of its sqlite file
+    '''
+    return db.path
+
+class ResultCache:
+    '''
+    Caches query results by normalised SQL text.
+    Entries are tagged with the database version they were read at, made of the file's
+    mtime and size and SQLite's PRAGMA data_version, so any committed write invalidates them.
+    Bounded by entry count and by total result size.
+    '''
+    def __init__(self, max_entries: int=256, max_bytes: int=32*1024*1024):
+        self.max_entries=max_entries
+        self.max_bytes=max_bytes
+        self.entries=OrderedDict()
+        self.total_bytes=0
+        self.watchers={}
+        self.lock=threading.Lock()
+        self.hits=0
+        self.misses=0
+        self.invalidations=0
+
+    def _version(self, db_path: str):
+        try:
+            stat=os.stat(db_path)
+        except OSError:
+            return None
+
+        watcher=self.watchers.get(db_path)
+        if watcher is None:
+            # data_version only moves for commits made by other connections, so this one never writes
+            watcher=sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+            self.watchers[db_path]=watcher
+        data_version=watcher.execute("PRAGMA data_version").fetchone()[0]
+        return (stat.st_mtime_ns, stat.st_size, data_version)
+
+    def _evict(self):
+        while self.entries and (len(self.entries)>self.max_entries or self.total_bytes>self.max_bytes):
+            _, (_, _, size)=self.entries.popitem(last=False)
+            self.total_bytes-=size
+
+    def get(self, db_path: str, query: str):
+        '''
+        Output: cached result, or None on a miss or stale entry
+        '''
+        key=(db_path, normalise_sql(query))
+        with self.lock:
+            version=self._version(db_path)
+            entry=self.entries.get(key)
+            if entry is not None and entry[0]!=version:
+                del self.entries[key]
+                self.total_bytes-=entry[2]
+                self.invalidations+=1
+                entry=None
+            if entry is None:
+                self.misses+=1
+                return None
+            self.entries.move_to_end(key)
+            self.hits+=1
+            return entry[1]
+
+    def version(self, db_path: str):
+        '''
+        Read before running a query and passed to put(), so a write that commits while
+        the query runs leaves the stored result already stale instead of tagged as current.
+        '''
+        with self.lock:
+            return self._version(db_path)
+
+    def put(self, db_path: str, query: str, result, version):
+        key=(db_path, normalise_sql(query))
+        # rough footprint of the stored rows, only used for eviction
+        size=len(str(result))
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes-=self.entries.pop(key)[2]
+            self.entries[key]=(version, result, size)
+            self.total_bytes+=size
+            self._evict()
+
+    def stats(self)->dict:
+        lookups=self.hits+self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits/lookups, 3) if lookups else None,
+            "invalidations": self.invalidations,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes
+        }
+
+result_cache=ResultCache()
@@ -0,0 +1,198 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+
+# question words that only match stored values after translation, mirrors the rewrite in write_sql_query
+value_synonyms={
+    "submarine": "subsurface", "submarines": "subsurface", "sub": "subsurface", "subs": "subsurface",
+    "ship": "surface", "ships": "surface", "vessel": "surface", "vessels": "surface",
+    "aircraft": "air", "helicopter": "air", "helicopters": "air", "plane": "air", "planes": "air",
+    "china": "chinese", "india": "indian", "pakistan": "pakistani", "usa": "american", "us": "american",
+}
+
+# columns every prompt keeps for a table, so the model can always select and order by them
+key_columns={"id", "name", "time"}
+
+# seconds between background refreshes of value lists and sample rows, taken only after the file changed
+values_refresh_seconds=float(os.environ.get("SCHEMA_VALUES_REFRESH", "60"))
+
+# bookkeeping tables kept in the query database that the model must not see, e.g. the ingest watermarks
+internal_table_prefixes=("sqlite_", "ingest_")
+
+def _connect(db_path: str)->sqlite3.Connection:
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+def _file_version(db_path: str)->tuple:
+    # in WAL mode commits land in the -wal file before the main file is checkpointed
+    return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else 0 for path in (db_path, db_path+"-wal"))
+
+def read_schema_version(db_path: str)->int:
+    '''
+    Output: sqlite's schema cookie, bumped by every CREATE, DROP or ALTER but not by row changes
+    '''
+    conn=_connect(db_path)
+    try:
+        return conn.execute("PRAGMA schema_version").fetchone()[0]
+    finally:
+        conn.close()
+
+def _question_terms(question: str)->set:
+    terms=set()
+    for word in re.findall(r"[a-z0-9_]+", question.lower()):
+        terms.add(word)
+        if word.endswith("s") and len(word)>3:
+            terms.add(word[:-1])
+        if word in value_synonyms:
+            terms.add(value_synonyms[word])
+    return terms
+
+class SchemaCatalog:
+    '''
+    Columns, types, sample rows and low-cardinality value lists of every table,
+    read once from the sqlite file instead of reflecting the schema on every request.
+    '''
+    def __init__(self, db_path: str, sample_rows: int=3, max_distinct: int=30):
+        self.db_path=db_path
+        self.sample_rows=sample_rows
+        self.max_distinct=max_distinct
+        self.tables={}
+        self.schema_version=None
+        self.file_version=None
+        self.refreshed_at=0.0
+        self.refreshing=False
+        self.build()
+
+    def build(self):
+        print("Building schema catalog")
+        conn=_connect(self.db_path)
+        try:
+            self.schema_version=conn.execute("PRAGMA schema_version").fetchone()[0]
+            names=[row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")]
+            names=[name for name in names if not name.startswith(internal_table_prefixes)]
+            structure={}
+            for table in names:
+                structure[table]=[(column, column_type or "TEXT") for _, column, column_type, _, _, _ in conn.execute(f'PRAGMA table_info("{table}")')]
+            self.tables=self._read_values(conn, structure)
+        finally:
+            conn.close()
+
+    def _read_values(self, conn, structure: dict)->dict:
+        '''
+        Input: (column, type) pairs per table
+        Output: tables with value lists of low-cardinality TEXT columns and sample rows
+        '''
+        # taken before reading, so rows committed meanwhile are picked up by the next refresh
+        self.file_version=_file_version(self.db_path)
+        self.refreshed_at=time.monotonic()
+        tables={}
+        for table, definitions in structure.items():
+            columns=[]
+            for column, column_type in definitions:
+                distinct=None
+                if column_type.upper()=="TEXT":
+                    count=conn.execute(f'SELECT COUNT(DISTINCT "{column}") FROM "{table}"').fetchone()[0]
+                    if count<=self.max_distinct:
+                        distinct=[row[0] for row in conn.execute(f'SELECT DISTINCT "{column}" FROM "{table}" WHERE "{column}" IS NOT NULL ORDER BY 1')]
+                columns.append({"name": column, "type": column_type, "distinct": distinct})
+            samples=conn.execute(f'SELECT * FROM "{table}" LIMIT {self.sample_rows}').fetchall()
+            tables[table]={"columns": columns, "samples": samples}
+        return tables
+
+    def refresh_values(self):
+        '''
+        Re-reads value lists and sample rows of the known tables, keeping their structure.
+        table_info serves the previous lists until the new ones replace them in one assignment.
+        '''
+        structure={table: [(c["name"], c["type"]) for c in info["columns"]] for table, info in self.tables.items()}
+        try:
+            conn=_connect(self.db_path)
+            try:
+                self.tables=self._read_values(conn, structure)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Could not refresh schema catalog values: {e}")
+
+    def schema_signature(self)->str:
+        '''
+        Table and column definitions only, unaffected by new rows.
+        '''
+        return "\n".join(f"{table}({', '.join(c['name']+' '+c['type'] for c in info['columns'])})" for table, info in self.tables.items())
+
+    def _relevant_columns(self, table: str, terms: set)->list:
+        relevant=[]
+        for column in self.tables[table]["columns"]:
+            name_terms=set(column["name"].lower().split("_"))
+            values={str(v).lower() for v in column["distinct"] or []}
+            if name_terms & terms or values & terms:
+                relevant.append(column["name"])
+        return relevant
+
+    def table_info(self, question: str=None)->str:
+        '''
+        Input: optional user question
+        Output: schema description for the SQL prompt.
+        With a question, only matching tables are described, and value lists and
+        sample rows are limited to the columns the question refers to.
+        '''
+        if question is None:
+            selected={table: [c["name"] for c in info["columns"]] for table, info in self.tables.items()}
+        else:
+            terms=_question_terms(question)
+            selected={}
+            for table in self.tables:
+                relevant=self._relevant_columns(table, terms)
+                if relevant or set(table.lower().split("_")) & terms:
+                    selected[table]=relevant
+            if not selected:
+                selected={table: [] for table in self.tables}
+
+        blocks=[]
+        for table, relevant in selected.items():
+            info=self.tables[table]
+            column_names=[c["name"] for c in info["columns"]]
+            shown=[name for name in column_names if name in relevant or name.lower() in key_columns]
+            definition=",\n\t".join(f'"{c["name"]}" {c["type"]}' for c in info["columns"])
+            block=f'CREATE TABLE "{table}" (\n\t{definition}\n)'
+
+            values=[f"{c['name']}: {', '.join(str(v) for v in c['distinct'])}" for c in info["columns"] if c["name"] in shown and c["distinct"]]
+            if values:
+                block+="\n/*\nAllowed values:\n"+"\n".join(values)+"\n*/"
+
+            if info["samples"]:
+                indexes=[column_names.index(name) for name in shown] or range(len(column_names))
+                header="\t".join(column_names[i] for i in indexes)
+                rows="\n".join("\t".join(str(row[i]) for i in indexes) for row in info["samples"])
+                block+=f"\n/*\n{len(info['samples'])} rows from {table} table:\n{header}\n{rows}\n*/"
+            blocks.append(block)
+        return "\n\n".join(blocks)
+
+catalogs={}
+catalog_lock=threading.Lock()
+
+def _refresh_in_background(catalog: SchemaCatalog):
+    try:
+        catalog.refresh_values()
+    finally:
+        with catalog_lock:
+            catalog.refreshing=False
+
+def get_catalog(db_path: str)->SchemaCatalog:
+    '''
+    Output: catalog for db_path.
+    The structure is rebuilt only when PRAGMA schema_version changes. Value lists and sample rows
+    are refreshed on a background thread, at most every values_refresh_seconds and only once the
+    file has changed, so requests never wait on the COUNT(DISTINCT) scans after startup.
+    '''
+    version=read_schema_version(db_path)
+    with catalog_lock:
+        catalog=catalogs.get(db_path)
+        if catalog is None or catalog.schema_version!=version:
+            catalog=SchemaCatalog(db_path)
+            catalogs[db_path]=catalog
+        elif not catalog.refreshing and time.monotonic()-catalog.refreshed_at>=values_refresh_seconds and _file_version(db_path)!=catalog.file_version:
+            catalog.refreshing=True
+            threading.Thread(target=_refresh_in_background, args=(catalog,), daemon=True).start()
+        return catalog
@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+default_cache_path=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql_files", "sql_cache.json")
+
+# words that do not change which rows a question asks for
+stopwords={"a", "an", "the", "all", "me", "give", "show", "list", "get", "find", "please", "of", "on", "about", "any", "every", "tell", "what", "are", "is", "there", "information", "info", "details", "data"}
+
+synonyms={
+    "subs": "submarine", "sub": "submarine", "submarines": "submarine",
+    "ships": "ship", "vessels": "ship", "vessel": "ship", "boats": "ship", "boat": "ship",
+    "aircrafts": "aircraft", "planes": "aircraft", "plane": "aircraft", "jets": "aircraft", "jet": "aircraft",
+    "helicopters": "helicopter", "helos": "helicopter", "helo": "helicopter",
+    "targets": "target", "contacts": "contact", "hostiles": "hostile",
+}
+
+def normalise_question(question: str)->str:
+    tokens=re.findall(r"[a-z0-9]+", question.lower())
+    tokens=[synonyms.get(token, token) for token in tokens]
+    return " ".join(token for token in tokens if token not in stopwords)
+
+@contextmanager
+def file_lock(path: str, timeout: float=10.0, stale: float=30.0):
+    '''
+    Cross-process lock held by creating path exclusively, so it works on Windows and POSIX alike.
+    A lock file older than stale seconds was left behind by a crashed writer and is taken over.
+    Raises TimeoutError, an OSError, when the lock is not acquired within timeout seconds.
+    '''
+    deadline=time.monotonic()+timeout
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time()-os.path.getmtime(path)>stale:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic()>deadline:
+                raise TimeoutError(f"Timed out waiting for lock {path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _trigrams(text: str)->set:
+    text=f"  {text} "
+    return {text[i:i+3] for i in range(len(text)-2)}
+
+def _jaccard(a: set, b: set)->float:
+    if not a and not b:
+        return 1.0
+    return len(a & b)/len(a | b)
+
+class SQLCache:
+    '''
+    Maps questions to SQL that has already run successfully.
+    Exact tier: identical normalised question.
+    Fuzzy tier: character trigram similarity, only between questions whose words differ
+    in stopwords, synonyms or order, so SQL written for another filter is never reused.
+    LRU bounded, persisted to a file shared between processes, and cleared when the schema changes.
+    '''
+    def __init__(self, path: str=default_cache_path, max_entries: int=512, fuzzy_threshold: float=0.7):
+        self.path=path
+        self.max_entries=max_entries
+        self.fuzzy_threshold=fuzzy_threshold
+        self.entries=OrderedDict()
+        self.schema_hash=None
+        self.lock=threading.Lock()
+        self.hits={"exact": 0, "fuzzy": 0}
+        self.misses=0
+        self._load()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Ignoring unreadable SQL cache: {e}")
+            return None
+
+    def _load(self):
+        data=self._read()
+        if data is None:
+            return
+        self.schema_hash=data.get("schema_hash")
+        for entry in data.get("entries", []):
+            entry["trigrams"]=_trigrams(entry["key"])
+            self.entries[entry["key"]]=entry
+
+    def _merge_from_disk(self):
+        '''
+        Adds entries another process saved to the same file since this one read it,
+        so that saving does not drop them. Entries saved under another schema are left out.
+        '''
+        data=self._read()
+        if data is None or data.get("schema_hash")!=self.schema_hash:
+            return
+        merged=OrderedDict()
+        for entry in data.get("entries", []):
+            if entry["key"] not in self.entries:
+                entry["trigrams"]=_trigrams(entry["key"])
+                merged[entry["key"]]=entry
+        if not merged:
+            return
+        # entries only on disk count as older than this process's own
+        merged.update(self.entries)
+        self.entries=merged
+        while len(self.entries)>self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _save(self):
+        '''
+        The report and analysis servers share the cache file, so the file is re-read
+        and merged under a lock before it is replaced.
+        '''
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path=f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with file_lock(f"{self.path}.lock"):
+                self._merge_from_disk()
+                data={
+                    "schema_hash": self.schema_hash,
+                    "entries": [{"key": e["key"], "question": e["question"], "sql": e["sql"]} for e in self.entries.values()]
+                }
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Could not persist SQL cache: {e}")
+
+    def set_schema(self, db_info: str):
+        '''
+        Drops every cached query when the schema text differs from the one the cache was built on.
+        '''
+        schema_hash=hashlib.sha1(db_info.encode("utf-8")).hexdigest()
+        with self.lock:
+            if schema_hash==self.schema_hash:
+                return
+            if self.entries:
+                print("Schema changed, clearing SQL cache")
+            self.entries.clear()
+            self.schema_hash=schema_hash
+            self._save()
+
+    def _fuzzy_match(self, key: str):
+        grams=_trigrams(key)
+        words=set(key.split())
+        best=None
+        best_score=self.fuzzy_threshold
+        for entry in self.entries.values():
+            score=_jaccard(grams, entry["trigrams"])
+            if score<best_score:
+                continue
+            # keys have stopwords dropped and synonyms mapped already, so any word left that
+            # differs is content: a filter, number, negation or time bound the cached SQL lacks
+            if words!=set(entry["key"].split()):
+                continue
+            best=entry
+            best_score=score
+        return best
+
+    def lookup(self, question: str):
+        '''
+        Input: user question
+        Output: cached SQL, or None
+        '''
+        key=normalise_question(question)
+        with self.lock:
+            entry=self.entries.get(key)
+            tier="exact"
+            if entry is None:
+                entry=self._fuzzy_match(key)
+                tier="fuzzy"
+            if entry is None:
+                self.misses+=1
+                return None
+            self.entries.move_to_end(entry["key"])
+            self.hits[tier]+=1
+        print(f"SQL cache {tier} hit for '{question}' (cached from '{entry['question']}')")
+        return entry["sql"]
+
+    def store(self, question: str, sql: str):
+        '''
+        Only call with SQL that executed without error.
+        '''
+        key=normalise_question(question)
+        with self.lock:
+            existing=self.entries.get(key)
+            if existing is not None and existing["sql"]==sql:
+                self.entries.move_to_end(key)
+                return
+            self.entries[key]={"key": key, "question": question, "sql": sql, "trigrams": _trigrams(key)}
+            self.entries.move_to_end(key)
+            while len(self.entries)>self.max_entries:
+                self.entries.popitem(last=False)
+            self._save()
+
+    def stats(self)->dict:
+        return {"entries": len(self.entries), "exact_hits": self.hits["exact"], "fuzzy_hits": self.hits["fuzzy"], "misses": self.misses}
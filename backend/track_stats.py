@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+from .query_result import format_for_prompt, is_error
+
+numeric_columns=("speed", "course", "range", "bearing", "altitude", "depth")
+label_columns=("name", "category", "nationality", "hostility")
+eez_column="location_wrt_naval_borders"
+poi_column="closest_point_of_mil_interest"
+
+def _float_array(values: list)->np.ndarray:
+    '''
+    Missing and non numeric values, e.g. "" or "N/A", become NaN and are left out of the statistics.
+    '''
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=float)
+
+def _fmt(value: float)->str:
+    return "n/a" if np.isnan(value) else f"{value:g}"
+
+def _trend(first: float, last: float, tolerance: float=1e-6)->str:
+    if np.isnan(first) or np.isnan(last):
+        return "unknown"
+    if last-first>tolerance:
+        return "increasing"
+    if first-last>tolerance:
+        return "decreasing"
+    return "steady"
+
+def track_statistics(result: dict)->list:
+    '''
+    Input: columnar query result with an "id" column
+    Output: one dict of movement statistics per target, computed with grouped NumPy reductions
+    '''
+    data=result["data"]
+    ids=np.array([str(v) for v in data["id"]])
+    times=np.array([str(v) for v in data["time"]]) if "time" in data else np.zeros(len(ids), dtype=str)
+
+    unique_ids, group=np.unique(ids, return_inverse=True)
+    order=np.lexsort((times, group))
+    group=group[order]
+    starts=np.flatnonzero(np.r_[True, group[1:]!=group[:-1]])
+    ends=np.r_[starts[1:], len(group)]-1
+    counts=ends-starts+1
+
+    stats=[{"id": unique_ids[group[start]], "reports": int(count)} for start, count in zip(starts, counts)]
+
+    if "time" in data:
+        sorted_times=times[order]
+        for entry, start, end in zip(stats, starts, ends):
+            entry["first_seen"]=sorted_times[start]
+            entry["last_seen"]=sorted_times[end]
+
+    for column in numeric_columns:
+        if column not in data:
+            continue
+        values=_float_array(data[column])[order]
+        valid=~np.isnan(values)
+        minimum=np.fmin.reduceat(values, starts)
+        maximum=np.fmax.reduceat(values, starts)
+        total=np.add.reduceat(np.where(valid, values, 0.0), starts)
+        n_valid=np.add.reduceat(valid.astype(int), starts)
+        positions=np.arange(len(values))
+        first_valid=np.minimum.reduceat(np.where(valid, positions, len(values)), starts)
+        last_valid=np.maximum.reduceat(np.where(valid, positions, -1), starts)
+        mean=np.divide(total, n_valid, out=np.full(len(starts), np.nan), where=n_valid>0)
+
+        if column=="course":
+            # headings wrap at 360, so spread is measured as circular variance (0 steady, 1 erratic)
+            radians=np.deg2rad(np.where(valid, values, 0.0))
+            cos_sum=np.add.reduceat(np.where(valid, np.cos(radians), 0.0), starts)
+            sin_sum=np.add.reduceat(np.where(valid, np.sin(radians), 0.0), starts)
+            resultant=np.divide(np.hypot(cos_sum, sin_sum), n_valid, out=np.full(len(starts), np.nan), where=n_valid>0)
+            circular_variance=1-resultant
+
+        for i, entry in enumerate(stats):
+            if n_valid[i]==0:
+                continue
+            entry[column]={"min": minimum[i], "max": maximum[i], "mean": mean[i], "first": values[first_valid[i]], "last": values[last_valid[i]]}
+            if column=="course":
+                entry[column]["circular_variance"]=circular_variance[i]
+
+    for column in label_columns:
+        if column in data:
+            values=np.array([str(v) for v in data[column]])[order]
+            for entry, start in zip(stats, starts):
+                entry[column]=values[start]
+
+    if eez_column in data:
+        values=np.array([str(v) for v in data[eez_column]])[order]
+        changed=np.r_[False, values[1:]!=values[:-1]] & np.r_[False, group[1:]==group[:-1]]
+        transitions=np.add.reduceat(changed.astype(int), starts)
+        for entry, start, end, count in zip(stats, starts, ends, transitions):
+            entry["eez_first"]=values[start]
+            entry["eez_last"]=values[end]
+            entry["eez_transitions"]=int(count)
+
+    if poi_column in data:
+        values=np.array([str(v) for v in data[poi_column]])[order]
+        for entry, start, end in zip(stats, starts, ends):
+            entry["points_of_interest"]=list(dict.fromkeys(values[start:end+1]))
+
+    return stats
+
+def _describe(entry: dict)->str:
+    parts=[f"id {entry['id']}"]
+    labels=[entry[column] for column in label_columns if column in entry]
+    if labels:
+        parts.append(", ".join(labels))
+    span=f"{entry['reports']} reports"
+    if "first_seen" in entry:
+        span+=f" from {entry['first_seen']} to {entry['last_seen']}"
+    parts.append(span)
+
+    for column in numeric_columns:
+        if column not in entry:
+            continue
+        s=entry[column]
+        if column in ("speed", "bearing"):
+            parts.append(f"{column} {_fmt(s['min'])}-{_fmt(s['max'])} (mean {_fmt(s['mean'])})")
+        elif column=="course":
+            parts.append(f"course {_fmt(s['min'])}-{_fmt(s['max'])} (circular variance {_fmt(round(s['circular_variance'], 2))})")
+        else:
+            parts.append(f"{column} {_fmt(s['first'])}->{_fmt(s['last'])} ({_trend(s['first'], s['last'])})")
+
+    if "eez_first" in entry:
+        if entry["eez_transitions"]:
+            parts.append(f"borders: {entry['eez_first']} -> {entry['eez_last']}, {entry['eez_transitions']} crossings")
+        else:
+            parts.append(f"borders: {entry['eez_first']} throughout")
+    if entry.get("points_of_interest"):
+        parts.append(f"closest points of interest: {', '.join(entry['points_of_interest'])}")
+    return " | ".join(parts)
+
+def summarise_tracks(result, sample_rows: int=5)->str:
+    '''
+    Input: columnar query result
+    Output: compact per-target movement facts followed by a few sample rows, for the report prompt.
+    Results without an id column are passed through as a plain table.
+    '''
+    if not isinstance(result, dict) or is_error(result) or not result["row_count"] or "id" not in result["data"]:
+        return format_for_prompt(result)
+
+    stats=track_statistics(result)
+    lines=[f"Per target statistics over all {result['row_count']}{'+' if result['truncated'] else ''} rows ({len(stats)} targets):"]
+    lines+=[_describe(entry) for entry in stats]
+    lines.append("")
+    lines.append("Sample rows:")
+    lines.append(format_for_prompt(result, max_rows=sample_rows))
+    return "\n".join(lines)
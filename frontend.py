@@ -1,6 +1,11 @@
 import streamlit as st
-from backend.main import load_model, app
-from backend.functions import State, pdf_result
+from backend.main import app
+from backend.metrics import metrics
+from backend.functions import State
+from backend.pdf_export import pdf_exporter
+from backend.model_manager import model_manager
+from backend.result_cache import result_cache
+from backend.query_result import format_for_ui, is_error
 import time
 
 st.set_page_config(page_title="Report Generation and Chatbot", page_icon="⚓")
@@ -10,13 +15,26 @@ st.caption("Allows you to generate and view reports, while being able to chat wi
 #model path
 model_path=f"C:\\Users\\caio\\code\\maritime_report_generation\\models\\dolphin3.0-llama3.2-3b-q5_k_m.gguf"
 
-#initialising everything
-llm=load_model(model_path)
+#model load options
+use_mlock=False
+idle_unload_seconds=30*60
+
+@st.cache_resource
+def initialise_model(path: str):
+    '''
+    Runs once per process; reruns and new sessions reuse the warm model.
+    '''
+    model_manager.configure(path, use_mmap=True, use_mlock=use_mlock, idle_timeout=idle_unload_seconds, warm_up=True)
+    model_manager.get()
+    return model_manager
 
+#initialising everything
 if 'llm_backend_initialization' not in st.session_state:
     with st.spinner("Initializing backend"):
-        pass
+        initialise_model(model_path)
     st.session_state.llm_backend_initialization=True
+else:
+    initialise_model(model_path)
 
 if "chat_history" not in st.session_state:
     st.session_state.chat_history=[]
@@ -36,12 +54,38 @@ if "langgraph_state" not in st.session_state:
     )
     st.session_state.langgraph_state=langgraph_state
 
+st.sidebar.subheader("Model status")
+model_status=model_manager.status()
+if model_manager.is_healthy():
+    st.sidebar.success(f"Model {model_status['state']}")
+else:
+    st.sidebar.error(f"Model {model_status['state']}: {model_status['error']}")
+st.sidebar.json(model_status, expanded=False)
+
+st.sidebar.subheader("Query result cache")
+st.sidebar.json(result_cache.stats(), expanded=False)
+
+st.sidebar.subheader("PDF export cache")
+st.sidebar.json(pdf_exporter.stats(), expanded=False)
+
+st.sidebar.subheader("Node timings")
+node_summary=metrics.summary()
+if node_summary:
+    last_nodes=metrics.last_invocation()
+    st.sidebar.caption("Last request: "+", ".join(f"{record['node']} {record['wall_seconds']:.2f}s" for record in last_nodes))
+    st.sidebar.dataframe(node_summary, hide_index=True)
+else:
+    st.sidebar.caption(f"No requests yet, node timings are appended to {metrics.log_file}")
+
 st.sidebar.subheader("Langgraph state inspector")
 display_state = st.session_state.langgraph_state.copy()
 if display_state.get("db"):
-    display_state["db"] = f"SQLDatabase connected: {display_state['db'].dialect}" # Or any other useful string representation
+    display_state["db"] = f"Database connected: {display_state['db'].dialect}" # Or any other useful string representation
 else:
     display_state["db"] = "Not connected"
+if display_state.get("result"):
+    result=display_state["result"]
+    display_state["result"] = result["error"] if is_error(result) else f"{result['row_count']} rows x {len(result['columns'])} columns{' (truncated)' if result['truncated'] else ''}"
 
 st.sidebar.json(display_state)
 
@@ -49,29 +93,39 @@ for message in st.session_state.chat_history:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
+last_result=st.session_state.langgraph_state.get("result")
+if last_result and not is_error(last_result) and last_result["row_count"]:
+    with st.expander(f"Last query result ({last_result['row_count']} rows)"):
+        st.dataframe(format_for_ui(last_result))
+
 report_content=st.session_state.langgraph_state.get("report", "")
 
 if report_content:
-    if st.button("Download Report"):
-        with st.spinner("Creating PDF document for report"):
-            try:
-                pdf_bytes=pdf_result(st.session_state.langgraph_state, file_path=None)
-
-                if pdf_bytes:
-                    st.download_button(
-                        label="Click to download the PDF",
-                        data=pdf_bytes,
-                        file_name="report.pdf",
-                        mime="application/pdf"
-                    )
-                else:
-                    st.error("No pdf bytes found, invalid report")
-
-            except Exception as e:
-                print(f"Probelm  in creating pdf report {e}")
-                st.exception(e)
+    llm_format=st.checkbox("Reformat with the model before rendering (slower)", value=False)
+    # started in the background when the report arrived; a cached, running or failed job is only looked up
+    pdf_key=pdf_exporter.submit(st.session_state.langgraph_state, llm_format=llm_format)
+    pdf_status=pdf_exporter.wait(pdf_key, timeout=0 if llm_format else 2)
+
+    if pdf_status=="ready":
+        pdf_bytes=pdf_exporter.read(pdf_key)
+        if pdf_bytes:
+            st.download_button(
+                label="Download Report",
+                data=pdf_bytes,
+                file_name="report.pdf",
+                mime="application/pdf"
+            )
+        else:
+            st.error("No pdf bytes found, invalid report")
+    elif pdf_status=="failed":
+        st.error(f"Problem in creating pdf report: {pdf_exporter.error(pdf_key)}")
+        if st.button("Retry PDF export"):
+            pdf_exporter.submit(st.session_state.langgraph_state, llm_format=llm_format, retry=True)
+            st.rerun()
     else:
-        st.info("Click button to download report.")
+        st.info("Creating PDF document for report in the background.")
+        if st.button("Check PDF again"):
+            st.rerun()
 
 user_query=st.chat_input("Enter Query: ")
 
@@ -84,29 +138,43 @@ if user_query:
     st.session_state.langgraph_state["question"]=user_query
     with st.spinner("Processing Command..."):
         try:
-            final_state=app.invoke(st.session_state.langgraph_state)
-            assistant_response=final_state.get("answer", "No answer generated.")
-            st.session_state.chat_history = final_state.get("chat_history", [])
-
-            end_time=time.time()
-            response_time=end_time-start_time
-
-            if st.session_state.chat_history:
-                last_message = st.session_state.chat_history[-1]
-                if last_message["role"] == "assistant":
-                    with st.chat_message("assistant"):
-                        st.markdown(last_message["content"])
-                        st.caption(f"Response time: {response_time:.2f} seconds")
-                        print(response_time)
-                else:
-                     with st.chat_message("assistant"):
-                        st.markdown(assistant_response)
+            final_state=None
+            streamed_report=""
+            first_token_time=None
+            with st.chat_message("assistant"):
+                response_placeholder=st.empty()
+                # "custom" carries report tokens as they are decoded, "values" the graph state after each node
+                for mode, chunk in app.stream(st.session_state.langgraph_state, stream_mode=["custom", "values"]):
+                    if mode=="custom" and "report_token" in chunk:
+                        if first_token_time is None:
+                            first_token_time=time.time()-start_time
+                        streamed_report+=chunk["report_token"]
+                        response_placeholder.markdown(streamed_report+"▌")
+                    elif mode=="values":
+                        final_state=chunk
+
+                assistant_response=final_state.get("answer", "No answer generated.")
+                st.session_state.chat_history = final_state.get("chat_history", [])
+
+                end_time=time.time()
+                response_time=end_time-start_time
+
+                if st.session_state.chat_history:
+                    last_message = st.session_state.chat_history[-1]
+                    if last_message["role"] == "assistant":
+                        response_placeholder.markdown(last_message["content"])
+                    else:
+                        response_placeholder.markdown(assistant_response)
+                    if first_token_time is not None:
+                        st.caption(f"Response time: {response_time:.2f} seconds (first token after {first_token_time:.2f} seconds)")
+                    else:
                         st.caption(f"Response time: {response_time:.2f} seconds")
-                        print(response_time)
+                    print(response_time)
             st.session_state.langgraph_state = final_state
 
             new_report_content=st.session_state.langgraph_state.get("report")
             if new_report_content and new_report_content!=previous_report_content:
+                pdf_exporter.submit(st.session_state.langgraph_state)
                 st.toast("Report generated, refreshing page")
                 st.rerun()
                 print(response_time)
@@ -0,0 +1,54 @@
+import os
+import sqlite3
+
+import pytest
+
+from backend import schema_catalog
+from backend.schema_catalog import get_catalog
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(schema_catalog, "catalogs", {})
+    monkeypatch.setattr(schema_catalog, "values_refresh_seconds", 0.0)
+    path=str(tmp_path/"tracks.db")
+    conn=sqlite3.connect(path)
+    conn.execute("CREATE TABLE OTAS_data (id TEXT, name TEXT, hostility TEXT)")
+    conn.execute("INSERT INTO OTAS_data VALUES ('1', 'rafale', 'friendly')")
+    conn.commit()
+    conn.close()
+    return path
+
+def execute(path: str, sql: str):
+    conn=sqlite3.connect(path)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+def wait_for_refresh(catalog):
+    for _ in range(200):
+        if not catalog.refreshing:
+            return
+        schema_catalog.time.sleep(0.01)
+
+def test_new_rows_refresh_values_without_rebuilding(db_path):
+    catalog=get_catalog(db_path)
+    execute(db_path, "INSERT INTO OTAS_data VALUES ('2', 'type 052d', 'hostile')")
+    # the insert may land within the file system's timestamp resolution
+    os.utime(db_path, ns=(1, 1))
+
+    assert get_catalog(db_path) is catalog
+    wait_for_refresh(catalog)
+    hostility=next(c for c in catalog.tables["OTAS_data"]["columns"] if c["name"]=="hostility")
+    assert hostility["distinct"]==["friendly", "hostile"]
+
+def test_schema_change_rebuilds(db_path):
+    catalog=get_catalog(db_path)
+    execute(db_path, "ALTER TABLE OTAS_data ADD COLUMN speed REAL")
+
+    rebuilt=get_catalog(db_path)
+    assert rebuilt is not catalog
+    assert "speed REAL" in rebuilt.schema_signature()
+
+def test_ingest_tables_are_hidden(db_path):
+    execute(db_path, "CREATE TABLE ingest_watermarks (source TEXT PRIMARY KEY, last_time TEXT)")
+    assert "ingest_watermarks" not in get_catalog(db_path).table_info()
@@ -0,0 +1,69 @@
+import pytest
+
+from backend.sql_cache import SQLCache
+
+sql="SELECT * FROM OTAS_data WHERE nationality='chinese' AND closest_point_of_mil_interest='mumbai'"
+
+@pytest.fixture
+def cache(tmp_path):
+    cache=SQLCache(path=str(tmp_path/"sql_cache.json"))
+    cache.store("chinese ships near mumbai", sql)
+    return cache
+
+@pytest.mark.parametrize("question", [
+    "chinese vessels near mumbai",
+    "give me chinese ships near mumbai",
+    "near mumbai chinese ships",
+])
+def test_synonym_and_word_order_variants_hit(cache, question):
+    assert cache.lookup(question)==sql
+
+@pytest.mark.parametrize("question", [
+    "chinese ships not near mumbai",
+    "chinese ships near mumbai today",
+    "chinese ships near mumbai in the last week",
+    "more than five chinese ships near mumbai",
+    "chinese ships near mumbai 2",
+    "average chinese ships near mumbai",
+])
+def test_qualifier_differences_miss(cache, question):
+    assert cache.lookup(question) is None
+
+@pytest.mark.parametrize("question", [
+    "hostile chinese ships near mumbai",
+    "chinese ships near mumbai speed",
+    "chinese ships near mumbai course",
+    "chinese ships near mumbai port",
+])
+def test_added_filter_words_miss(cache, question):
+    assert cache.lookup(question) is None
+
+def test_added_filter_miss_is_not_stored_over_the_original(cache):
+    other="SELECT * FROM OTAS_data WHERE nationality='chinese' AND hostility='hostile'"
+    cache.store("hostile chinese ships near mumbai", other)
+    assert cache.lookup("chinese ships near mumbai")==sql
+    assert cache.lookup("hostile chinese ships near mumbai")==other
+
+def test_processes_sharing_the_file_keep_each_others_entries(tmp_path):
+    path=str(tmp_path/"sql_cache.json")
+    report=SQLCache(path=path)
+    analysis=SQLCache(path=path)
+    report.set_schema("schema")
+    analysis.set_schema("schema")
+    report.store("chinese ships near mumbai", sql)
+    analysis.store("friendly aircraft near goa", "SELECT name FROM OTAS_data WHERE hostility='friendly'")
+
+    reloaded=SQLCache(path=path)
+    assert reloaded.lookup("chinese ships near mumbai")==sql
+    assert reloaded.lookup("friendly aircraft near goa") is not None
+
+def test_schema_change_drops_entries_saved_by_other_processes(tmp_path):
+    path=str(tmp_path/"sql_cache.json")
+    old=SQLCache(path=path)
+    old.set_schema("schema")
+    old.store("chinese ships near mumbai", sql)
+
+    new=SQLCache(path=path)
+    new.set_schema("changed schema")
+    new.store("friendly aircraft near goa", "SELECT name FROM OTAS_data WHERE hostility='friendly'")
+    assert SQLCache(path=path).lookup("chinese ships near mumbai") is None
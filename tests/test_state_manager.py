@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MCP"))
+
+import state_manager
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_manager, "STATE_DB", str(tmp_path/"state.db"))
+    monkeypatch.setattr(state_manager, "LEGACY_STATE_FILE", str(tmp_path/"state.json"))
+    monkeypatch.setattr(state_manager, "MAX_SESSION_BYTES", 4096)
+    monkeypatch.setattr(state_manager._local, "conn", None, raising=False)
+    yield state_manager
+    state_manager._local.conn.close()
+    state_manager._local.conn=None
+
+def test_chat_entries_past_the_cap_evict_older_state(state):
+    state.update_field("result", "r"*1500, session_id="s")
+    for i in range(20):
+        state.add_chat_entry(f"question {i}", "a"*600, "analysis", session_id="s")
+
+    history=state.read_field("chat_history", session_id="s")
+    assert history[-1]["user_input"]=="question 19"
+    assert len(history)<20
+    assert state.session_usage()["s"]["bytes"]<=state.MAX_SESSION_BYTES
+
+def test_write_state_past_the_cap_keeps_newest_fields(state):
+    state.update_field("report", "x"*3000, session_id="s")
+    state.write_state({"analysis": "y"*3000}, session_id="s")
+
+    assert state.read_field("analysis", session_id="s")=="y"*3000
+    assert state.read_field("report", session_id="s")==""
+
+def test_single_value_over_the_cap_is_refused(state):
+    state.update_field("report", "small", session_id="s")
+    state.update_field("report", "z"*5000, session_id="s")
+
+    assert state.read_field("report", session_id="s")=="small"